@@ -1,6 +1,8 @@
 # This file is the entry point for AWS Elastic Beanstalk.
 # It imports the Flask app instance from your application package.
 
+import os
+
 from shopping_list_app.app import create_app
 
 application = create_app()
@@ -15,7 +17,8 @@ if __name__ == '__main__':
     # For SocketIO support, Flask-SocketIO's run method is needed.
     from shopping_list_app.extensions import socketio # Ensure socketio is initialized in extensions.py and imported here
     
-    # Consider making host, port, and debug configurable via environment variables for flexibility.
+    # HOST and PORT let several worker processes run side by side (see SOCKETIO_MESSAGE_QUEUE).
     # For true development, use run_dev.bat. For production-like local test, debug=False.
-    socketio.run(application, host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+    socketio.run(application, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)),
+                 debug=False, use_reloader=False, log_output=False)
 
@@ -0,0 +1,61 @@
+"""
+Benchmark: compiled keyword automaton vs. the naive keyword loop.
+
+Categorizes a corpus of realistic item names with categorize() (Aho-Corasick)
+and with categorize_naive() (the line-by-line port of main.js), checks that they
+agree, and prints the time per name for short and long inputs.
+
+Usage:
+    python benchmarks/categorize_benchmark.py [--names 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shopping_list_app.categorize import (  # noqa: E402
+    GROCERY_CATEGORIES, categorize, categorize_many, categorize_naive
+)
+
+FILLER = ['bio', 'fresh', 'large', '500g', 'family pack', 'organic', 'no. 2', 'extra', 'x', 'light']
+
+
+def build_corpus(count, words_per_name, seed=1):
+    rng = random.Random(seed)
+    keywords = [keyword for _, words in GROCERY_CATEGORIES for keyword in words]
+    names = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER) for _ in range(words_per_name)]
+        if rng.random() < 0.8:
+            parts[rng.randrange(len(parts))] = rng.choice(keywords).title()
+        names.append(' '.join(parts))
+    return names
+
+
+def bench(label, func, names, repeat=3):
+    best = min(timeit.repeat(lambda: [func(name) for name in names], number=1, repeat=repeat))
+    print(f'  {label:<22} {best * 1e6 / len(names):8.2f} us/name')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=20000, help='names per corpus')
+    args = parser.parse_args()
+
+    for words_per_name in (2, 12):
+        names = build_corpus(args.names, words_per_name)
+        mismatches = [name for name in names if categorize(name) != categorize_naive(name)]
+        print(f'{args.names} names, {words_per_name} words each ({len(mismatches)} mismatches)')
+        naive = bench('naive keyword loop', categorize_naive, names)
+        automaton = bench('automaton', categorize, names)
+        batch = min(timeit.repeat(lambda: categorize_many(names), number=1, repeat=3))
+        print(f'  {"automaton, batch":<22} {batch * 1e6 / len(names):8.2f} us/name')
+        print(f'  speedup: {naive / automaton:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Harness: Socket.IO fan-out across N worker processes.
+
+Starts a fakeredis server (pip install fakeredis), then --workers app processes
+on consecutive ports, all with SOCKETIO_MESSAGE_QUEUE pointing at it and
+sharing one SQLite database. The workers use the same Redis client manager as
+production. One websocket client per worker
+joins the same list room. Each round adds an item through the HTTP API of one
+worker (round robin) and deletes it again, and checks that item_added and
+item_deleted reach the clients of every worker. It then prints the delivery
+latency, measured from sending the HTTP request, for clients on the origin
+worker and on the other workers. Events arrive through each worker's outbox
+dispatcher, so the latency includes the outbox hop.
+
+Usage:
+    python benchmarks/fanout_harness.py [--workers 3] [--rounds 20]
+
+Set --broker-url to use a real Redis server instead (e.g. redis://localhost:6379/0).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import queue
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+USERNAME, PASSWORD = 'fanout', 'fanout-password'
+
+
+def serve_fakeredis(port):
+    from fakeredis import TcpFakeServer
+    TcpFakeServer(('127.0.0.1', port), server_type='redis').serve_forever()
+
+
+def init_db():
+    from shopping_list_app.app import create_app
+    from shopping_list_app.models import db, User, ShoppingList
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username=USERNAME)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        shopping_list = ShoppingList(name='Fan-out List', owner_id=user.id)
+        db.session.add(shopping_list)
+        db.session.commit()
+        print(shopping_list.id)
+
+
+class SocketClient:
+    """A minimal Engine.IO 4 / Socket.IO 5 websocket client that records the events it receives."""
+
+    def __init__(self, port, cookie):
+        import simple_websocket
+        self.events = queue.Queue()
+        self.acks = queue.Queue()
+        # A worker that has just started occasionally misses its first handshake; try again
+        for attempt in range(3):
+            self.ws = simple_websocket.Client(
+                f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket', headers={'Cookie': cookie})
+            opened = self.ws.receive(timeout=5)
+            if opened is not None:
+                break
+            self.ws.close()
+        assert opened.startswith('0')  # Engine.IO open
+        self.ws.send('40')
+        # The server's connect handler may emit (reconnect_hint) before acknowledging the namespace
+        reply = self.ws.receive(timeout=5)
+        while reply.startswith('42'):
+            reply = self.ws.receive(timeout=5)
+        assert reply.startswith('40')  # Namespace connected
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        while True:
+            try:
+                message = self.ws.receive()
+            except Exception:
+                return
+            received_at = time.perf_counter()
+            if message == '2':
+                self.ws.send('3')  # Pong
+            elif message.startswith('42'):
+                event, data = json.loads(message[2:])
+                if event == 'list_delta':
+                    # Outbox batches: one message carries several list events
+                    for list_event in data['events']:
+                        self.events.put((received_at, list_event['event'], list_event['data']))
+                else:
+                    self.events.put((received_at, event, data))
+            elif message.startswith('43'):
+                self.acks.put(message)
+
+    def join(self, list_id):
+        self.ws.send('421' + json.dumps(['join_list_room', {'list_id': list_id}]))
+        self.acks.get(timeout=5)
+
+    def wait_for(self, event, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while True:
+            received_at, name, data = self.events.get(timeout=max(0.0, deadline - time.monotonic()))
+            if name == event and predicate(data):
+                return received_at
+
+    def close(self):
+        self.ws.close()
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Nothing listening on port {port}')
+
+
+def http_session(port):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'username': USERNAME, 'password': PASSWORD}).encode()
+    opener.open(f'http://127.0.0.1:{port}/auth/login', data=data)
+    cookie = '; '.join(f'{c.name}={c.value}' for c in jar)
+    return opener, cookie
+
+
+def post_json(opener, url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with opener.open(request) as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--broker-port', type=int, default=6390)
+    parser.add_argument('--broker-url', help='use this Redis server instead of starting fakeredis')
+    parser.add_argument('--init-db', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--serve-fakeredis', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.init_db:
+        return init_db()
+    if args.serve_fakeredis:
+        return serve_fakeredis(args.broker_port)
+
+    workdir = tempfile.mkdtemp(prefix='fanout-')
+    env = dict(os.environ,
+               PYTHONPATH=ROOT,
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'fanout.db'),
+               SECRET_KEY='fanout-harness',
+               SESSION_TYPE='filesystem',
+               SOCKETIO_MESSAGE_QUEUE=args.broker_url or f'redis://127.0.0.1:{args.broker_port}/0',
+               PYTHONWARNINGS='ignore')
+    processes = []
+    clients = []
+    try:
+        if not args.broker_url:
+            processes.append(subprocess.Popen(
+                [sys.executable, __file__, '--serve-fakeredis', '--broker-port', str(args.broker_port)],
+                cwd=workdir, env=env, stderr=subprocess.DEVNULL))
+            wait_for_port(args.broker_port)
+        list_id = int(subprocess.run([sys.executable, __file__, '--init-db'], cwd=workdir, env=env,
+                                     check=True, capture_output=True, text=True).stdout.split()[-1])
+
+        ports = [args.base_port + n for n in range(args.workers)]
+        for port in ports:
+            processes.append(subprocess.Popen([sys.executable, os.path.join(ROOT, 'application.py')],
+                                              cwd=workdir, env=dict(env, HOST='127.0.0.1', PORT=str(port)),
+                                              stderr=subprocess.DEVNULL))
+        for port in ports:
+            wait_for_port(port)
+
+        sessions = [http_session(port) for port in ports]
+        for port, (_, cookie) in zip(ports, sessions):
+            client = SocketClient(port, cookie)
+            client.join(list_id)
+            clients.append(client)
+
+        local, remote = [], []
+        for round_number in range(args.rounds):
+            origin = round_number % len(ports)
+            opener = sessions[origin][0]
+            base_url = f'http://127.0.0.1:{ports[origin]}/api/list/{list_id}'
+
+            sent_at = time.perf_counter()
+            item = post_json(opener, base_url + '/add_item', {'item_name': f'Fan-out item {round_number}'})['item']
+            for index, client in enumerate(clients):
+                received_at = client.wait_for('item_added', lambda data: data['item']['id'] == item['id'])
+                (local if index == origin else remote).append(received_at - sent_at)
+
+            sent_at = time.perf_counter()
+            post_json(opener, base_url + '/delete_item', {'item_id': item['id']})
+            for index, client in enumerate(clients):
+                received_at = client.wait_for('item_deleted', lambda data: data['item_id'] == item['id'])
+                (local if index == origin else remote).append(received_at - sent_at)
+
+        print(f'{args.workers} workers, {args.rounds} rounds: every item_added/item_deleted reached all workers')
+        for label, latencies in (('origin worker', local), ('other workers', remote)):
+            if latencies:
+                print(f'  {label:<14} p50 {statistics.median(latencies) * 1000:7.2f} ms  '
+                      f'max {max(latencies) * 1000:7.2f} ms  ({len(latencies)} deliveries)')
+    finally:
+        for client in clients:
+            client.close()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: query plans and timings of the hot queries with and without the
+composite indexes added in migration d2a9c4e7f610.
+
+Builds a SQLite database with many users, lists, shares and items, drops the
+three indexes, prints EXPLAIN QUERY PLAN and the time of each hot query, then
+recreates the indexes and repeats. Without the indexes SQLite scans the table
+(or sorts through a temporary B-tree); with them every query is a SEARCH on
+the index.
+
+Usage:
+    python benchmarks/index_benchmark.py [--lists 2000] [--items-per-list 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text  # noqa: E402
+
+from shopping_list_app.app import create_app  # noqa: E402
+from shopping_list_app.models import db, User, ShoppingList, ListItem, ListShare  # noqa: E402
+
+INDEXES = {
+    'ix_list_item_list_id_added_at': 'list_item (list_id, added_at)',
+    'ix_list_share_user_id': 'list_share (user_id)',
+    'ix_shopping_list_owner_id_created_at': 'shopping_list (owner_id, created_at)',
+}
+
+HOT_QUERIES = {
+    'items of a list by added_at':
+        'SELECT id, item_name FROM list_item WHERE list_id = :list_id ORDER BY added_at',
+    'lists shared with a user':
+        'SELECT list_id FROM list_share WHERE user_id = :user_id',
+    'lists owned by a user, newest first':
+        'SELECT id, name FROM shopping_list WHERE owner_id = :user_id ORDER BY created_at DESC',
+}
+
+
+def populate(lists, items_per_list, users=500, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    db.session.execute(User.__table__.insert(), [
+        {'id': n, 'username': f'user{n}', 'password_hash': 'x'} for n in range(1, users + 1)
+    ])
+    db.session.execute(ShoppingList.__table__.insert(), [
+        {'id': n, 'name': f'List {n}', 'owner_id': rng.randint(1, users),
+         'created_at': start + timedelta(minutes=n)} for n in range(1, lists + 1)
+    ])
+    shares = {(rng.randint(1, lists), rng.randint(1, users)) for _ in range(lists * 2)}
+    db.session.execute(ListShare.__table__.insert(), [
+        {'list_id': list_id, 'user_id': user_id} for list_id, user_id in shares
+    ])
+    # Items arrive interleaved across lists, as in production
+    db.session.execute(ListItem.__table__.insert(), [
+        {'list_id': rng.randint(1, lists), 'item_name': f'Item {n}', 'category': 'Other',
+         'is_purchased': False, 'added_by_id': rng.randint(1, users),
+         'added_at': start + timedelta(seconds=n)} for n in range(lists * items_per_list)
+    ])
+    db.session.commit()
+
+
+def report(title, params):
+    print(f'\n== {title} ==')
+    for label, sql in HOT_QUERIES.items():
+        plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql), params).all()
+        seconds = min(timeit.repeat(lambda: db.session.execute(text(sql), params).all(), number=20, repeat=3)) / 20
+        print(f'{label}: {seconds * 1000:.3f} ms')
+        for row in plan:
+            print(f'    {row[-1]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lists', type=int, default=2000)
+    parser.add_argument('--items-per-list', type=int, default=50)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + db_path
+    app = create_app({'TESTING': True})
+    try:
+        with app.app_context():
+            db.create_all()
+            populate(args.lists, args.items_per_list)
+            params = {'list_id': args.lists // 2, 'user_id': 42}
+
+            for name in INDEXES:
+                db.session.execute(text(f'DROP INDEX {name}'))
+            db.session.execute(text('ANALYZE'))
+            report('without indexes', params)
+
+            for name, target in INDEXES.items():
+                db.session.execute(text(f'CREATE INDEX {name} ON {target}'))
+            db.session.execute(text('ANALYZE'))
+            report('with indexes', params)
+            db.session.remove()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
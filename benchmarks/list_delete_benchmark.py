@@ -0,0 +1,117 @@
+"""
+Benchmark: deleting a list with many items, ORM cascade vs set-based DELETEs.
+
+Builds a SQLite database holding one list with --items items (plus shares and
+a change-log entry per item), then deletes it the old way, with
+session.delete() and the relationship cascade, which loads every item and
+share and deletes them one by one (logging a tombstone for each item), and
+rebuilds it and deletes it with main.purge_list(), one DELETE per table. Prints the wall time, the peak Python
+memory allocated during the delete (tracemalloc) and the SQL statements sent.
+
+Usage:
+    python benchmarks/list_delete_benchmark.py [--items 50000] [--shares 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import delete, event  # noqa: E402
+
+from shopping_list_app.app import create_app  # noqa: E402
+from shopping_list_app.main import purge_list  # noqa: E402
+from shopping_list_app.models import db, User, ShoppingList, ListItem, ListShare, ListChange  # noqa: E402
+
+LIST_ID = 1
+
+
+def populate(items, shares):
+    start = datetime(2025, 1, 1)
+    db.session.execute(ShoppingList.__table__.insert(), [
+        {'id': LIST_ID, 'name': 'Big List', 'owner_id': 1, 'created_at': start,
+         'item_count': items, 'open_item_count': sum(1 for n in range(1, items + 1) if n % 3),
+         'version': items, 'updated_at': start}
+    ])
+    db.session.execute(ListShare.__table__.insert(), [
+        {'list_id': LIST_ID, 'user_id': user_id} for user_id in range(2, shares + 2)
+    ])
+    db.session.execute(ListItem.__table__.insert(), [
+        {'id': n, 'list_id': LIST_ID, 'item_name': f'Item {n}', 'category': 'Other',
+         'is_purchased': n % 3 == 0, 'added_by_id': 1, 'added_at': start + timedelta(seconds=n)}
+        for n in range(1, items + 1)
+    ])
+    db.session.execute(ListChange.__table__.insert(), [
+        {'list_id': LIST_ID, 'seq': n, 'item_id': n, 'change_type': 'added', 'changed_at': start}
+        for n in range(1, items + 1)
+    ])
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def orm_cascade_delete():
+    db.session.delete(db.session.get(ShoppingList, LIST_ID))
+    # The cascade logs a tombstone per item; the change log is then dropped as the old route's listener did
+    db.session.flush()
+    db.session.execute(delete(ListChange).where(ListChange.list_id == LIST_ID))
+
+
+def set_based_delete():
+    purge_list(LIST_ID)
+
+
+def measure(delete_list):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        delete_list()
+        db.session.commit()
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert db.session.query(ListItem).filter_by(list_id=LIST_ID).count() == 0
+    return elapsed, peak, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--shares', type=int, default=20)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + db_path
+    app = create_app({'TESTING': True})
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.execute(User.__table__.insert(), [
+                {'id': n, 'username': f'user{n}', 'password_hash': 'x'} for n in range(1, args.shares + 2)
+            ])
+            db.session.commit()
+
+            print(f'Deleting a list with {args.items} items, {args.items} change-log entries and {args.shares} shares')
+            for label, delete_list in (('ORM cascade', orm_cascade_delete), ('set-based DELETEs', set_based_delete)):
+                populate(args.items, args.shares)
+                elapsed, peak, statements = measure(delete_list)
+                print(f'  {label:<18} {elapsed * 1000:9.1f} ms   peak {peak / 2 ** 20:7.1f} MiB   '
+                      f'{statements} statements')
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: realtime event latency during a login burst.
+
+A "realtime" greenlet stands in for the Socket.IO traffic of the process: it
+wakes every --tick-ms and records how late it was scheduled, which is how long
+an emit or a websocket frame would have waited for the hub. Meanwhile
+--concurrency greenlets log in --logins times in total through the app's
+/auth/login route. The burst is run twice: with password hashing on the hub
+(PASSWORD_HASH_OFFLOAD=False, the old behaviour) and offloaded to eventlet's
+thread pool.
+
+Usage:
+    python benchmarks/login_burst_benchmark.py [--logins 40] [--concurrency 8] [--iterations 1000000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import eventlet  # noqa: E402
+from eventlet.greenpool import GreenPool  # noqa: E402
+
+from shopping_list_app.app import create_app  # noqa: E402
+from shopping_list_app.models import db, User  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_burst(app, users, logins, concurrency, tick):
+    lags = []
+    running = True
+
+    def realtime():
+        while running:
+            scheduled = time.perf_counter() + tick
+            eventlet.sleep(tick)
+            lags.append(max(0.0, time.perf_counter() - scheduled))
+
+    def login(n):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'username': users[n % len(users)], 'password': 'password'})
+        assert response.status_code == 302, response.status_code
+
+    ticker = eventlet.spawn(realtime)
+    eventlet.sleep(tick * 2)
+    started_at = time.perf_counter()
+    pool = GreenPool(concurrency)
+    for _ in pool.imap(login, range(logins)):
+        pass
+    elapsed = time.perf_counter() - started_at
+    running = False
+    ticker.wait()
+    return elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=1000000, help='PBKDF2 work factor')
+    parser.add_argument('--tick-ms', type=float, default=10.0)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + db_path
+    app = create_app({'TESTING': True})
+    app.config['PASSWORD_HASH_ITERATIONS'] = args.iterations
+    try:
+        with app.app_context():
+            db.create_all()
+            users = [f'burst{n}' for n in range(args.concurrency)]
+            for username in users:
+                user = User(username=username)
+                user.set_password('password')
+                db.session.add(user)
+            db.session.commit()
+            db.session.remove()
+
+        print(f'{args.logins} logins, {args.concurrency} concurrent, pbkdf2:sha256:{args.iterations}, '
+              f'{args.tick_ms:.0f} ms realtime tick')
+        for label, offload in (('hashing on the hub', False), ('hashing in tpool', True)):
+            app.config['PASSWORD_HASH_OFFLOAD'] = offload
+            elapsed, lags = run_burst(app, users, args.logins, args.concurrency, args.tick_ms / 1000)
+            print(f'  {label:<20} {args.logins / elapsed:7.1f} logins/s   event lag '
+                  f'p50 {statistics.median(lags) * 1000:7.1f} ms  '
+                  f'p99 {percentile(lags, 0.99) * 1000:7.1f} ms  '
+                  f'max {max(lags) * 1000:7.1f} ms')
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Add list_item_archive table and the purchased_at column of list_item
+
+Revision ID: 5e8b2f4a9c60
+Revises: 9c1e5a7d3b24
+Create Date: 2025-07-11 09:26:17.804153
+
+Items already ticked off get their added_at (or, without one, the time of the
+migration) as purchased_at, so the first archival run picks up the old ones.
+As in d2a9c4e7f610, the list_item indexes are built CONCURRENTLY on PostgreSQL.
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b2f4a9c60'
+down_revision = '9c1e5a7d3b24'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_list_item_purchased_at', 'list_item', ['purchased_at']),
+    ('ix_list_item_added_at', 'list_item', ['added_at']),
+]
+
+
+def _is_postgresql():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade():
+    op.create_table('list_item_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('list_id', sa.Integer(), nullable=False),
+    sa.Column('item_name', sa.String(length=200), nullable=False),
+    sa.Column('category', sa.String(length=100), nullable=False),
+    sa.Column('is_purchased', sa.Boolean(), nullable=False),
+    sa.Column('added_by_id', sa.Integer(), nullable=False),
+    sa.Column('added_at', sa.DateTime(), nullable=True),
+    sa.Column('purchased_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['added_by_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['list_id'], ['shopping_list.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_list_item_archive_list_id_archived_at_id', 'list_item_archive',
+                    ['list_id', 'archived_at', 'id'])
+
+    with op.batch_alter_table('list_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('purchased_at', sa.DateTime(), nullable=True))
+    op.execute(sa.text('UPDATE list_item SET purchased_at = coalesce(added_at, :now) '
+                       'WHERE is_purchased AND purchased_at IS NULL').bindparams(now=datetime.utcnow()))
+
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, _ in INDEXES:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True)
+
+    with op.batch_alter_table('list_item', schema=None) as batch_op:
+        batch_op.drop_column('purchased_at')
+    op.drop_index('ix_list_item_archive_list_id_archived_at_id', table_name='list_item_archive')
+    op.drop_table('list_item_archive')
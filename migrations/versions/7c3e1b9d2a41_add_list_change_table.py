@@ -0,0 +1,34 @@
+"""Add list_change table for per-list versioned change log
+
+Revision ID: 7c3e1b9d2a41
+Revises: 420f78808244
+Create Date: 2025-06-20 09:12:41.118503
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e1b9d2a41'
+down_revision = '420f78808244'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('list_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('list_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('change_type', sa.String(length=20), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['list_id'], ['shopping_list.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('list_id', 'seq', name='_list_seq_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('list_change')
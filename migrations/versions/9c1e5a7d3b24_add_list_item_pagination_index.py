@@ -0,0 +1,52 @@
+"""Add the keyset pagination index of list_item and make category NOT NULL
+
+Revision ID: 9c1e5a7d3b24
+Revises: f4b2d7c91a06
+Create Date: 2025-07-04 10:12:48.530271
+
+Items are paged by (category, added_at, id); a NULL category would drop out of
+the row-value comparisons, so old rows without one are moved to 'Other' first.
+As in d2a9c4e7f610, the index is built CONCURRENTLY on PostgreSQL.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e5a7d3b24'
+down_revision = 'f4b2d7c91a06'
+branch_labels = None
+depends_on = None
+
+
+INDEX = ('ix_list_item_list_id_category_added_at_id', 'list_item', ['list_id', 'category', 'added_at', 'id'])
+
+
+def _is_postgresql():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade():
+    op.execute("UPDATE list_item SET category = 'Other' WHERE category IS NULL")
+    with op.batch_alter_table('list_item', schema=None) as batch_op:
+        batch_op.alter_column('category', existing_type=sa.String(length=100), nullable=False)
+
+    name, table, columns = INDEX
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    name, table, _ = INDEX
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+    with op.batch_alter_table('list_item', schema=None) as batch_op:
+        batch_op.alter_column('category', existing_type=sa.String(length=100), nullable=True)
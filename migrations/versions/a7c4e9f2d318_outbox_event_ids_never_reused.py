@@ -0,0 +1,38 @@
+"""Make outbox_event ids AUTOINCREMENT on SQLite
+
+Revision ID: a7c4e9f2d318
+Revises: b3d8f1c6e472
+Create Date: 2025-07-18 10:41:52.603117
+
+The row id is the event's seq for clients. Without AUTOINCREMENT, SQLite hands
+out id 1 again once the dispatcher has emptied the table, and clients drop the
+event as a repeat. The table is rebuilt with AUTOINCREMENT; PostgreSQL
+sequences never go backwards, so there is nothing to do there.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e9f2d318'
+down_revision = 'b3d8f1c6e472'
+branch_labels = None
+depends_on = None
+
+
+def _is_sqlite():
+    return op.get_context().dialect.name == 'sqlite'
+
+
+def upgrade():
+    if _is_sqlite():
+        with op.batch_alter_table('outbox_event', recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade():
+    if _is_sqlite():
+        with op.batch_alter_table('outbox_event', recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': False}):
+            pass
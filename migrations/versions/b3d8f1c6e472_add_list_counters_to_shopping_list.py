@@ -0,0 +1,45 @@
+"""Add the denormalized item_count, open_item_count, version and updated_at columns to shopping_list
+
+Revision ID: b3d8f1c6e472
+Revises: 5e8b2f4a9c60
+Create Date: 2025-07-15 14:02:39.116842
+
+The columns are filled from list_item and list_change with the same statement
+as `flask repair-list-counters`, one UPDATE for all lists.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8f1c6e472'
+down_revision = '5e8b2f4a9c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('shopping_list', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('open_item_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE shopping_list SET
+            item_count = (SELECT count(*) FROM list_item WHERE list_item.list_id = shopping_list.id),
+            open_item_count = (SELECT count(*) FROM list_item
+                               WHERE list_item.list_id = shopping_list.id AND NOT list_item.is_purchased),
+            version = (SELECT coalesce(max(seq), 0) FROM list_change WHERE list_change.list_id = shopping_list.id),
+            updated_at = coalesce((SELECT max(changed_at) FROM list_change
+                                   WHERE list_change.list_id = shopping_list.id), created_at)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('shopping_list', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
+        batch_op.drop_column('open_item_count')
+        batch_op.drop_column('item_count')
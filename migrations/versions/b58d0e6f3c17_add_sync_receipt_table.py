@@ -0,0 +1,35 @@
+"""Add sync_receipt table for idempotent offline queue replays
+
+Revision ID: b58d0e6f3c17
+Revises: 7c3e1b9d2a41
+Create Date: 2025-06-23 18:40:05.512930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58d0e6f3c17'
+down_revision = '7c3e1b9d2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_receipt',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('list_id', sa.Integer(), nullable=False),
+    sa.Column('temp_id', sa.String(length=64), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['list_id'], ['shopping_list.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'temp_id', name='_user_temp_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('sync_receipt')
@@ -0,0 +1,35 @@
+"""Scope sync_receipt's unique temp_id to the list
+
+Revision ID: c5d1a8e3f947
+Revises: a7c4e9f2d318
+Create Date: 2025-07-18 16:05:33.271904
+
+Receipts are looked up by (user_id, list_id, temp_id), so a temp_id replayed
+against another list is applied there instead of answering with the first
+list's item. The unique constraint moves from (user_id, temp_id) to
+(user_id, list_id, temp_id) to allow that.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d1a8e3f947'
+down_revision = 'a7c4e9f2d318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sync_receipt', schema=None) as batch_op:
+        batch_op.drop_constraint('_user_temp_uc', type_='unique')
+        batch_op.create_unique_constraint('_user_list_temp_uc', ['user_id', 'list_id', 'temp_id'])
+
+
+def downgrade():
+    # A temp_id used on several lists keeps only its oldest receipt
+    op.execute('DELETE FROM sync_receipt WHERE id NOT IN '
+               '(SELECT min(id) FROM sync_receipt GROUP BY user_id, temp_id)')
+    with op.batch_alter_table('sync_receipt', schema=None) as batch_op:
+        batch_op.drop_constraint('_user_list_temp_uc', type_='unique')
+        batch_op.create_unique_constraint('_user_temp_uc', ['user_id', 'temp_id'])
@@ -0,0 +1,53 @@
+"""Add composite indexes for the hot query paths
+
+Revision ID: d2a9c4e7f610
+Revises: b58d0e6f3c17
+Create Date: 2025-06-27 11:05:33.274816
+
+On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY, which does
+not block writes but cannot run inside a transaction, so those statements run
+in an autocommit block. Other databases (SQLite in development) build them
+normally. IF NOT EXISTS makes a rerun after an interrupted concurrent build safe;
+an interrupted build can leave an INVALID index behind, which must be dropped
+by hand before rerunning.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a9c4e7f610'
+down_revision = 'b58d0e6f3c17'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_list_item_list_id_added_at', 'list_item', ['list_id', 'added_at']),
+    ('ix_list_share_user_id', 'list_share', ['user_id']),
+    ('ix_shopping_list_owner_id_created_at', 'shopping_list', ['owner_id', 'created_at']),
+]
+
+
+def _is_postgresql():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, _ in INDEXES:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True)
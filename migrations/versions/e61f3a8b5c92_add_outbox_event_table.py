@@ -0,0 +1,31 @@
+"""Add outbox_event table for transactional realtime events
+
+Revision ID: e61f3a8b5c92
+Revises: d2a9c4e7f610
+Create Date: 2025-06-30 09:12:41.803515
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61f3a8b5c92'
+down_revision = 'd2a9c4e7f610'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('list_id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('outbox_event')
@@ -0,0 +1,26 @@
+"""Add origin_sid to outbox_event
+
+Revision ID: f4b2d7c91a06
+Revises: e61f3a8b5c92
+Create Date: 2025-07-02 14:27:09.315862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b2d7c91a06'
+down_revision = 'e61f3a8b5c92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('outbox_event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('origin_sid', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_event', schema=None) as batch_op:
+        batch_op.drop_column('origin_sid')
@@ -0,0 +1,89 @@
+"""
+Central access control for shopping lists.
+
+resolve_list_access() answers "may this user see this list?" together with the
+few list fields the routes need, using at most one query: a join of the list
+with the user's share row. Results are memoized for the current request in
+flask.g and across requests in a per-app TTL cache keyed by (user_id, list_id).
+Call invalidate_list_access() whenever shares change or a list is deleted.
+
+Only grants are cached across requests, so a newly shared list opens at once on
+every worker. The cache is per process, though, and invalidation reaches only
+the worker that made the change: other workers keep a removed share, or the
+owner of a deleted list (whose id SQLite may hand to the next new list), for up
+to ACCESS_CACHE_TTL seconds.
+"""
+from collections import namedtuple
+
+from flask import abort, current_app, g
+from flask_login import current_user
+from sqlalchemy import select
+
+from .cache import get_app_cache
+from .models import db, ShoppingList, ListShare
+
+
+class ListAccess(namedtuple('ListAccess', ['id', 'name', 'owner_id', 'is_owner', 'is_shared_with_user'])):
+    """The lightweight view of a list and the caller's relation to it."""
+    __slots__ = ()
+
+    @property
+    def allowed(self):
+        return self.is_owner or self.is_shared_with_user
+
+
+def _access_cache():
+    return get_app_cache('list_access',
+                         maxsize=current_app.config.get('ACCESS_CACHE_SIZE', 10000),
+                         ttl=current_app.config.get('ACCESS_CACHE_TTL', 60))
+
+
+def resolve_list_access(list_id, user_id=None):
+    """Return the ListAccess of a user (default: current user) to a list, or None if the list does not exist."""
+    if user_id is None:
+        user_id = current_user.id
+    key = (user_id, list_id)
+
+    memo = g.setdefault('list_access', {})
+    if key in memo:
+        return memo[key]
+
+    cache = _access_cache()
+    access = cache.get(key)
+    if access is None:
+        row = db.session.execute(
+            select(ShoppingList.id, ShoppingList.name, ShoppingList.owner_id, ListShare.id.label('share_id'))
+            .outerjoin(ListShare, (ListShare.list_id == ShoppingList.id) & (ListShare.user_id == user_id))
+            .where(ShoppingList.id == list_id)
+        ).first()
+        if row is None:
+            # Missing lists are not cached; the id may be reused by a new list
+            return None
+        access = ListAccess(row.id, row.name, row.owner_id,
+                            is_owner=row.owner_id == user_id,
+                            is_shared_with_user=row.share_id is not None)
+        if access.allowed:
+            cache.set(key, access)
+
+    memo[key] = access
+    return access
+
+
+def get_list_access_or_404(list_id, user_id=None):
+    """Like resolve_list_access(), but abort with 404 if the list does not exist."""
+    access = resolve_list_access(list_id, user_id)
+    if access is None:
+        abort(404)
+    return access
+
+
+def invalidate_list_access(list_id, user_id=None):
+    """Forget cached access for one user of a list, or for all users of it."""
+    if user_id is not None:
+        _access_cache().pop((user_id, list_id))
+    else:
+        _access_cache().discard_where(lambda key: key[1] == list_id)
+    memo = g.get('list_access')
+    if memo:
+        for key in [key for key in memo if key[1] == list_id and user_id in (None, key[0])]:
+            del memo[key]
@@ -1,10 +1,13 @@
 import eventlet
 eventlet.monkey_patch()
 
+import hashlib
+import logging
 import os
 import sys
-from flask import Flask, session
-from flask_socketio import join_room, leave_room # Added join_room, leave_room
+from flask import Flask, request, session
+from flask_login import current_user
+from flask_socketio import emit
 from datetime import timedelta
 
 # Check if we're running on Windows
@@ -18,12 +21,39 @@ if not (IS_WINDOWS and os.environ.get('FLASK_ENV') == 'development'):
 
 # Import models and db from models.py
 from .models import db, User, ShoppingList, ListItem, ListShare
+from . import changelog  # Registers the list change-log mapper events
 
 # Import extensions from extensions.py
 from .extensions import login_manager, socketio
+from .fanout import create_client_manager
+from .identity import load_identity
+from .logs import configure_logging
+from .metrics import get_metrics, init_metrics
+from .outbox import init_outbox
+from .archive import init_archive
+from .counters import init_counters
+from .passwords import configure_password_hashing
+from .access import resolve_list_access
+from .realtime import get_connect_rate, get_room_members, join_list, leave_list, list_room, reconnect_hint
 from flask_migrate import Migrate
 
 migrate = Migrate()
+logger = logging.getLogger(__name__)
+
+
+def _asset_digest(app):
+    """Hash the templates and static files, so every worker of one deploy derives the same BUILD_ID."""
+    digest = hashlib.sha1()
+    for folder in (app.template_folder, app.static_folder):
+        root = os.path.join(app.root_path, folder)
+        for dirpath, dirnames, filenames in sorted(os.walk(root)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
 
 def create_app(config_overrides=None):
     """Create and configure an instance of the Flask application."""
@@ -62,15 +92,59 @@ def create_app(config_overrides=None):
     app.config['REMEMBER_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
     app.config['REMEMBER_COOKIE_HTTPONLY'] = True
 
+    # Observability: DEBUG records are sampled at LOG_SAMPLE_RATE; /metrics is only served with a METRICS_TOKEN
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+    # Password hashing runs in eventlet's OS thread pool; see passwords.py. Without
+    # PASSWORD_HASH_ITERATIONS, new hashes use werkzeug's default work factor
+    if os.environ.get('PASSWORD_HASH_ITERATIONS'):
+        app.config['PASSWORD_HASH_ITERATIONS'] = int(os.environ['PASSWORD_HASH_ITERATIONS'])
+    if os.environ.get('PASSWORD_HASH_THREADS'):
+        app.config['PASSWORD_HASH_THREADS'] = int(os.environ['PASSWORD_HASH_THREADS'])
+
+    # Cached list grants outlive a removed share or a deleted list on other workers for up to this long; see access.py
+    app.config['ACCESS_CACHE_TTL'] = float(os.environ.get('ACCESS_CACHE_TTL', '60'))
+
+    # List events are stored in the outbox table and emitted by a background dispatcher; see outbox.py
+    app.config['OUTBOX_BATCH_SIZE'] = int(os.environ.get('OUTBOX_BATCH_SIZE', '500'))
+    app.config['OUTBOX_POLL_INTERVAL'] = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1.0'))
+    # Edits within REALTIME_COALESCE_WINDOW seconds share one message; at most REALTIME_ROOM_MAX_RATE messages/s per room
+    app.config['REALTIME_COALESCE_WINDOW'] = float(os.environ.get('REALTIME_COALESCE_WINDOW', '0.05'))
+    app.config['REALTIME_ROOM_MAX_RATE'] = float(os.environ.get('REALTIME_ROOM_MAX_RATE', '10'))
+
+    # Long-poll (updates?wait=) and server-sent events; waiters re-read the version every UPDATES_WAIT_RECHECK s
+    app.config['UPDATES_MAX_WAIT'] = float(os.environ.get('UPDATES_MAX_WAIT', '25'))
+    app.config['UPDATES_WAIT_RECHECK'] = float(os.environ.get('UPDATES_WAIT_RECHECK', '5'))
+    app.config['SSE_HEARTBEAT'] = float(os.environ.get('SSE_HEARTBEAT', '15'))
+    app.config['SSE_MAX_DURATION'] = float(os.environ.get('SSE_MAX_DURATION', '300'))
+    # Reconnect backoff handed to clients, stretched while over RECONNECT_STORM_RATE connections/s; see realtime.py
+    app.config['RECONNECT_DELAY'] = float(os.environ.get('RECONNECT_DELAY', '1.0'))
+    app.config['RECONNECT_DELAY_MAX'] = float(os.environ.get('RECONNECT_DELAY_MAX', '30'))
+    app.config['RECONNECT_STORM_RATE'] = float(os.environ.get('RECONNECT_STORM_RATE', '50'))
+    # Updates deltas are shared by concurrent callers and kept LIST_DELTA_CACHE_TTL seconds
+    app.config['LIST_DELTA_CACHE_TTL'] = float(os.environ.get('LIST_DELTA_CACHE_TTL', '5'))
+    # Items ticked off ARCHIVE_PURCHASED_AFTER hours ago or added ARCHIVE_ITEM_MAX_AGE days ago move to the archive; see archive.py
+    app.config['ARCHIVE_INTERVAL'] = float(os.environ.get('ARCHIVE_INTERVAL', '3600'))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+    app.config['ARCHIVE_PURCHASED_AFTER'] = float(os.environ.get('ARCHIVE_PURCHASED_AFTER', '24'))
+    app.config['ARCHIVE_ITEM_MAX_AGE'] = float(os.environ.get('ARCHIVE_ITEM_MAX_AGE', '0'))  # 0: open items stay
+
     if config_overrides:
         app.config.update(config_overrides)
 
+    # Part of the list page's validator, so a deploy with new HTML or JS is never answered with 304
+    if not app.config.get('BUILD_ID'):
+        app.config['BUILD_ID'] = os.environ.get('BUILD_ID') or _asset_digest(app)
+
     # Specific test configurations
     if app.config.get('TESTING'):
         app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
         app.config['WTF_CSRF_ENABLED'] = False
         app.config['LOGIN_DISABLED'] = False
         app.config['SECRET_KEY'] = 'test_secret_key' # Consistent key for tests
+        app.config['PASSWORD_HASH_ITERATIONS'] = 1000 # Fast hashes for the many test logins
 
     # Initialize extensions with app
     db.init_app(app)
@@ -80,8 +154,20 @@ def create_app(config_overrides=None):
     if not (IS_WINDOWS and os.environ.get('FLASK_ENV') == 'development') and not app.config.get('TESTING', False):
         Session(app) # Initialize Flask-Session
 
-    socketio.init_app(app, async_mode='eventlet', message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
+    # With several worker processes, events fan out through SOCKETIO_MESSAGE_QUEUE (see fanout.py)
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE', os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
+    client_manager = create_client_manager(message_queue)
+    if client_manager is not None:
+        socketio.init_app(app, async_mode='eventlet', client_manager=client_manager)
+    else:
+        socketio.init_app(app, async_mode='eventlet', message_queue=message_queue)
     migrate.init_app(app, db)
+    configure_logging(app)
+    configure_password_hashing(app)
+    init_metrics(app)
+    init_outbox(app)
+    init_archive(app)
+    init_counters(app)
 
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -89,7 +175,7 @@ def create_app(config_overrides=None):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_identity(user_id)
 
     # Import and register blueprints
     from .auth import auth as auth_blueprint
@@ -117,19 +203,37 @@ if __name__ == '__main__':
     # Use socketio.run for development to enable WebSocket support
     socketio.run(app, debug=True, host='0.0.0.0', port=5000) # Pass debug to socketio.run
 
+@socketio.on('connect')
+def handle_connect(*args):
+    # Clients back off longer before their next reconnect while many are connecting at once
+    emit('reconnect_hint', reconnect_hint(get_connect_rate().record()))
+
 @socketio.on('join_list_room')
 def handle_join_list_room(data):
-    list_id = data.get('list_id')
-    if list_id:
-        room_name = f'list_{list_id}'
-        join_room(room_name)
-        print(f'Client joined room: {room_name}') # Server-side log for debugging
-        # You could also emit a confirmation back to the client if needed
+    try:
+        list_id = int((data or {}).get('list_id'))
+    except (TypeError, ValueError):
+        return {'success': False, 'error': 'Missing list_id'}
+    if not current_user.is_authenticated:
+        return {'success': False, 'error': 'Login required'}
+    access = resolve_list_access(list_id, current_user.id)
+    if access is None or not access.allowed:
+        get_metrics().observe_join_denied()
+        logger.info('Denied room join for user %s to list %s', current_user.id, list_id)
+        return {'success': False, 'error': 'Access denied'}
+    join_list(list_id, request.sid, current_user.id)
+    logger.debug('Client joined room: %s', list_room(list_id))
+    return {'success': True}
 
 @socketio.on('leave_list_room') # Optional: if you want explicit leave handling
 def handle_leave_list_room(data):
-    list_id = data.get('list_id')
-    if list_id:
-        room_name = f'list_{list_id}'
-        leave_room(room_name)
-        print(f'Client left room: {room_name}') # Server-side log for debugging
+    try:
+        list_id = int((data or {}).get('list_id'))
+    except (TypeError, ValueError):
+        return
+    leave_list(list_id, request.sid)
+    logger.debug('Client left room: %s', list_room(list_id))
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    get_room_members().remove_sid(request.sid)
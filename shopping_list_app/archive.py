@@ -0,0 +1,146 @@
+"""
+Archival of purchased and old items.
+
+Nothing ever leaves list_item on its own, and every per-list query gets slower
+as it grows. A background job per process moves the items that are done with
+into list_item_archive: items ticked off more than ARCHIVE_PURCHASED_AFTER
+hours ago, and items added more than ARCHIVE_ITEM_MAX_AGE days ago. The
+latter removes open items from users' lists, so it is off unless an operator
+sets it (the default 0 keeps open items however old they are). GET /api/list/<id>/history reads the archive
+back on demand.
+
+Each batch is one transaction: a DELETE ... RETURNING of up to
+ARCHIVE_BATCH_SIZE due items, an INSERT of the returned rows into the archive
+(under their own ids, as SQLite hands a deleted item's id to the next item),
+and a tombstone per item in the change log plus an 'items_deleted' event, so
+open clients drop the items as if they had been deleted. The DELETE re-checks
+that each row is still due, so an item unticked in the meantime stays, and a
+row can only be moved once even when the jobs of several workers run at the
+same time. The job runs every ARCHIVE_INTERVAL seconds and yields between
+batches.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import eventlet
+from flask import current_app
+from sqlalchemy import delete, event, insert, inspect, or_, select
+
+from .changelog import record_changes, CHANGE_DELETED
+from .models import db, ListItem, ListItemArchive
+from .outbox import enqueue_event
+
+logger = logging.getLogger(__name__)
+
+# Columns copied from list_item to list_item_archive; the item's id goes to item_id
+ARCHIVED_COLUMNS = ('list_id', 'item_name', 'category', 'is_purchased', 'added_by_id', 'added_at', 'purchased_at')
+
+
+def _due_for_archival(now):
+    config = current_app.config
+    due = ListItem.purchased_at < now - timedelta(hours=config.get('ARCHIVE_PURCHASED_AFTER', 24))
+    max_age = config.get('ARCHIVE_ITEM_MAX_AGE', 0)
+    if max_age:
+        due = or_(due, ListItem.added_at < now - timedelta(days=max_age))
+    return due
+
+
+def archive_batch(limit=None, now=None):
+    """Move one batch of due items into list_item_archive; return the number of items moved."""
+    limit = limit or current_app.config.get('ARCHIVE_BATCH_SIZE', 1000)
+    now = now or datetime.utcnow()
+    due = _due_for_archival(now)
+    columns = [ListItem.id.label('item_id')] + [getattr(ListItem, name) for name in ARCHIVED_COLUMNS]
+    try:
+        rows = db.session.execute(
+            delete(ListItem)
+            .where(ListItem.id.in_(select(ListItem.id).where(due).limit(limit)), due)
+            .returning(*columns)
+            .execution_options(synchronize_session=False)
+        ).all()
+        rows.sort(key=lambda row: row.item_id)
+        if not rows:
+            db.session.rollback()
+            return 0
+        db.session.execute(insert(ListItemArchive),
+                           [dict(row._mapping, archived_at=now) for row in rows])
+
+        # A bulk statement bypasses the mapper events, so the tombstones are logged here
+        rows_by_list = {}
+        for row in rows:
+            rows_by_list.setdefault(row.list_id, []).append(row)
+        for list_id, list_rows in rows_by_list.items():
+            item_ids = sorted(row.item_id for row in list_rows)
+            record_changes(list_id, item_ids, CHANGE_DELETED,
+                           open_delta=-sum(1 for row in list_rows if not row.is_purchased))
+            enqueue_event(list_id, 'items_deleted', {'item_ids': item_ids, 'list_id': list_id, 'archived': True})
+        db.session.commit()
+        return len(rows)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class ArchiveJob:
+    """Background greenlet that archives the due items of one application every ARCHIVE_INTERVAL seconds."""
+
+    def __init__(self, app):
+        self.app = app
+        self.greenlet = None
+
+    def start(self):
+        if self.greenlet is None:
+            self.greenlet = eventlet.spawn(self._run)
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    def _run(self):
+        interval = self.app.config.get('ARCHIVE_INTERVAL', 3600)
+        while True:
+            self.run_once()
+            eventlet.sleep(interval)
+
+    def run_once(self):
+        """Archive batches until no item is due or a batch fails; return the number of items moved."""
+        moved = 0
+        with self.app.app_context():
+            try:
+                while True:
+                    batch = archive_batch()
+                    if not batch:
+                        break
+                    moved += batch
+                    eventlet.sleep(0)  # Let requests run between batches
+            except Exception:
+                logger.exception('Item archival failed; the items will be archived by the next run')
+        if moved:
+            logger.info('Archived %s items', moved)
+        return moved
+
+
+@event.listens_for(ListItem, 'before_insert')
+@event.listens_for(ListItem, 'before_update')
+def _stamp_purchased_at(mapper, connection, target):
+    # ORM writes that tick an item off without a time still become due for archival
+    if target.is_purchased and target.purchased_at is None:
+        target.purchased_at = datetime.utcnow()
+    elif not target.is_purchased and inspect(target).attrs.is_purchased.history.has_changes():
+        target.purchased_at = None
+
+
+def get_archive_job(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.get('shopping_list_archive')
+
+
+def init_archive(app):
+    """Create the app's archive job, started by its first request unless ARCHIVE_JOB is False."""
+    job = app.extensions['shopping_list_archive'] = ArchiveJob(app)
+
+    @app.before_request
+    def _start_archive_job():
+        if job.greenlet is None and app.config.get('ARCHIVE_JOB', not app.testing):
+            job.start()
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 from .models import db, User # Import from models.py instead of app.py
+from .passwords import hash_password, verify_password, needs_rehash
 from datetime import timedelta
 
 auth = Blueprint('auth', __name__)
@@ -14,7 +14,11 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password_hash, password):
+        if user and verify_password(user.password_hash, password):
+            # Upgrade hashes made with an older work factor while we have the password
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
             # Always remember the user for persistent login
             login_user(user, remember=True, duration=timedelta(days=365))  # 1 year duration
             # Set session to permanent
@@ -47,7 +51,7 @@ def register():
         # Create new user
         new_user = User(
             username=username, 
-            password_hash=generate_password_hash(password, method='pbkdf2:sha256')
+            password_hash=hash_password(password)
         )
         db.session.add(new_user)
         db.session.commit()
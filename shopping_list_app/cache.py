@@ -0,0 +1,113 @@
+"""
+Small in-process caches shared across requests.
+
+Caches are stored per application in app.extensions so that several app
+instances (as in the test suite) never see each other's entries.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+_MISSING = object()
+
+
+class _Flight:
+    """A value being computed by one caller and awaited by the others."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """A size-bounded LRU mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        """
+        Return the value of `key`, calling create() to compute and cache it on a miss.
+
+        Concurrent misses for the same key share a single create() call: the
+        first caller computes the value and the others wait for it (and see its
+        exception, if it fails).
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = create()
+            self.set(key, flight.value)
+            return flight.value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def discard_where(self, predicate):
+        """Remove every entry whose key satisfies predicate(key)."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_app_cache(name, maxsize, ttl):
+    """Return the named TTLCache of the current app, creating it on first use."""
+    caches = current_app.extensions.setdefault('shopping_list_caches', {})
+    cache = caches.get(name)
+    if cache is None:
+        cache = caches[name] = TTLCache(maxsize=maxsize, ttl=ttl)
+    return cache
@@ -0,0 +1,202 @@
+"""
+Server-side item categorization.
+
+Mirrors determineCategory() in static/js/main.js: the same bilingual keyword
+table, the same priority overrides, and the same tie-breaking, so an item gets
+the same category whether the browser or the server picks it.
+
+Instead of testing every keyword with a substring search, all keywords are
+compiled once into an Aho-Corasick automaton. Each automaton state knows the
+best rule among all keywords that end there, so categorizing a name is a single
+pass over its characters, independent of the number of keywords.
+"""
+from collections import deque
+
+DEFAULT_CATEGORY = 'Other'
+
+# Keep in sync with groceryCategories in static/js/main.js (tests/test_categorize.py checks this)
+GROCERY_CATEGORIES = (
+    ('Fruits', (
+        'apple', 'apfel', 'banana', 'banane', 'orange', 'beeren', 'berries', 'grape', 'traube',
+        'mango', 'pineapple', 'ananas', 'avocado', 'peach', 'pfirsich', 'plum', 'pflaume',
+        'strawberry', 'erdbeere', 'raspberry', 'himbeere', 'blueberry', 'blaubeere',
+        'heidelbeere', 'kiwi', 'lemon', 'zitrone', 'lime', 'limette')),
+    ('Vegetables', (
+        'carrot', 'karotte', 'möhre', 'broccoli', 'brokkoli', 'spinach', 'spinat', 'onion',
+        'zwiebel', 'garlic', 'knoblauch', 'potato', 'kartoffel', 'tomato', 'tomate', 'lettuce',
+        'salat', 'kopfsalat', 'cabbage', 'kohl', 'pepper', 'paprika', 'cucumber', 'gurke',
+        'zucchini', 'celery', 'sellerie', 'corn', 'mais', 'mushroom', 'pilz', 'champignon',
+        'pea', 'erbse', 'green beans', 'grüne bohnen')),
+    ('Dairy', (
+        'milk', 'milch', 'cheese', 'käse', 'yogurt', 'joghurt', 'butter', 'cream', 'sahne',
+        'quark', 'sour cream', 'saure sahne', 'schmand', 'cottage cheese', 'hüttenkäse',
+        'körniger frischkäse')),
+    ('Bakery', (
+        'bread', 'brot', 'rolls', 'brötchen', 'bagel', 'croissant', 'muffin', 'cake', 'kuchen',
+        'donuts', 'donut', 'cookies', 'kekse', 'plätzchen', 'pie', 'obstkuchen')),
+    ('Meat & Poultry', (
+        'chicken', 'huhn', 'hähnchen', 'beef', 'rindfleisch', 'pork', 'schweinefleisch',
+        'turkey', 'pute', 'putenfleisch', 'sausage', 'wurst', 'würstchen', 'bacon', 'speck',
+        'lamb', 'lamm', 'lammfleisch', 'ham', 'schinken', 'mince', 'hackfleisch', 'ground meat')),
+    ('Fish & Seafood', (
+        'salmon', 'lachs', 'tuna', 'thunfisch', 'shrimp', 'garnele', 'krabbe', 'cod',
+        'kabeljau', 'dorsch', 'tilapia', 'crab', 'krebs', 'lobster', 'hummer', 'herring',
+        'hering', 'trout', 'forelle')),
+    ('Pantry Staples', (
+        'pasta', 'nudeln', 'rice', 'reis', 'flour', 'mehl', 'sugar', 'zucker', 'oil', 'öl',
+        'vinegar', 'essig', 'spices', 'gewürze', 'herbs', 'kräuter', 'canned goods',
+        'konserven', 'dosenware', 'beans', 'bohnen', 'lentils', 'linsen', 'cereal', 'müsli',
+        'cornflakes', 'getreideflocken', 'oats', 'haferflocken', 'jam', 'marmelade', 'honey',
+        'honig', 'peanut butter', 'erdnussbutter', 'nuts', 'nüsse', 'seeds', 'samen', 'kerne',
+        'broth', 'brühe', 'soup', 'suppe', 'chocolate', 'schokolade', 'ketchup', 'mustard',
+        'senf', 'mayonnaise', 'mayo')),
+    ('Frozen Foods', (
+        'ice cream', 'eis', 'eiscreme', 'frozen vegetables', 'tiefkühlgemüse', 'tk-gemüse',
+        'frozen fruit', 'tiefkühlobst', 'tk-obst', 'frozen meals', 'fertiggerichte',
+        'tk-fertiggerichte', 'pizza', 'tiefkühlpizza', 'tk-pizza', 'fries', 'pommes',
+        'frozen fish', 'tk-fisch')),
+    ('Beverages', (
+        'water', 'wasser', 'juice', 'saft', 'soda', 'limo', 'limonade', 'tea', 'tee', 'coffee',
+        'kaffee', 'milkshake', 'milchshake', 'sports drink', 'sportgetränk', 'isodrink', 'beer',
+        'bier', 'wine', 'wein', 'cola')),
+    ('Household', (
+        'toilet paper', 'toilettenpapier', 'klopapier', 'paper towels', 'küchenrolle',
+        'papiertücher', 'soap', 'seife', 'shampoo', 'detergent', 'waschmittel', 'spülmittel',
+        'cleaning supplies', 'putzmittel', 'reinigungsmittel', 'trash bags', 'müllbeutel',
+        'foil', 'alufolie', 'plastic wrap', 'frischhaltefolie', 'batteries', 'batterien',
+        'light bulb', 'glühbirne')),
+)
+
+# Checked before the keyword table, in this order; the first rule with any match wins
+PRIORITY_RULES = (
+    ('Frozen Foods', ('frozen', 'tiefkühl', 'tk-')),
+    ('Beverages', ('juice', 'saft')),
+    ('Beverages', ('coffee', 'kaffee')),
+    ('Household', ('toilet paper', 'toilettenpapier', 'klopapier')),
+    ('Pantry Staples', ('chocolate', 'schokolade')),
+)
+
+_NO_PRIORITY = len(PRIORITY_RULES)
+# Match ranks are (-keyword length, table position); this sorts after every real match
+_NO_MATCH = (0, 0)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over the priority and category keywords.
+
+    For every state it precomputes, over all keywords that end in that state
+    (including those reachable through failure links), the lowest priority rule
+    index and the best general match. The general match rank is
+    (-length, table position): longest keyword first, earlier keyword on ties,
+    exactly as the strict ">" comparison in the JavaScript loop behaves.
+    """
+
+    def __init__(self, categories=GROCERY_CATEGORIES, priority_rules=PRIORITY_RULES):
+        self.priority_categories = [category for category, _ in priority_rules]
+        self.categories = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._priority = [_NO_PRIORITY]
+        self._best = [_NO_MATCH]
+
+        for rule_index, (_, keywords) in enumerate(priority_rules):
+            for keyword in keywords:
+                state = self._add(keyword.lower())
+                self._priority[state] = min(self._priority[state], rule_index)
+
+        position = 0
+        for category, keywords in categories:
+            for keyword in keywords:
+                keyword = keyword.lower()
+                position += 1
+                self.categories.append(category)
+                state = self._add(keyword)
+                self._best[state] = min(self._best[state], (-len(keyword), position))
+
+        self._link()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._priority.append(_NO_PRIORITY)
+                self._best.append(_NO_MATCH)
+                self._goto[state][char] = next_state
+            state = next_state
+        return state
+
+    def _link(self):
+        # Breadth-first, so every failure target is complete before it is inherited from
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fail = self._fail[state]
+            self._priority[state] = min(self._priority[state], self._priority[fail])
+            self._best[state] = min(self._best[state], self._best[fail])
+            for char, child in self._goto[state].items():
+                target = fail
+                while target and char not in self._goto[target]:
+                    target = self._fail[target]
+                self._fail[child] = self._goto[target].get(char, 0)
+                queue.append(child)
+
+    def categorize(self, item_name):
+        """Return the category of an item name."""
+        goto, fail, priority, best = self._goto, self._fail, self._priority, self._best
+        state = 0
+        top_priority = _NO_PRIORITY
+        top_match = _NO_MATCH
+        for char in item_name.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if priority[state] < top_priority:
+                top_priority = priority[state]
+            if best[state] < top_match:
+                top_match = best[state]
+        if top_priority != _NO_PRIORITY:
+            return self.priority_categories[top_priority]
+        if top_match != _NO_MATCH:
+            return self.categories[top_match[1] - 1]
+        return DEFAULT_CATEGORY
+
+
+_automaton = KeywordAutomaton()
+
+
+def categorize(item_name):
+    """Return the category for an item name, as determineCategory() in main.js would."""
+    return _automaton.categorize(item_name)
+
+
+def categorize_many(item_names):
+    """Categorize a batch of names (e.g. an import), computing each distinct name once."""
+    seen = {}
+    return [seen[name] if name in seen else seen.setdefault(name, _automaton.categorize(name))
+            for name in item_names]
+
+
+def categorize_naive(item_name):
+    """
+    Reference implementation: a line-by-line port of determineCategory().
+
+    Quadratic in practice (every keyword is searched for in the name); kept for
+    tests and benchmarks to check the automaton against.
+    """
+    lower_item_name = item_name.lower()
+    for category, keywords in PRIORITY_RULES:
+        if any(keyword in lower_item_name for keyword in keywords):
+            return category
+
+    best_category, best_length = DEFAULT_CATEGORY, 0
+    for category, keywords in GROCERY_CATEGORIES:
+        for keyword in keywords:
+            lower_keyword = keyword.lower()
+            if lower_keyword in lower_item_name and len(lower_keyword) > best_length:
+                best_category, best_length = category, len(lower_keyword)
+    return best_category
@@ -0,0 +1,143 @@
+"""
+Per-list change log.
+
+Every insert, update and delete of a ListItem is appended to the list_change
+table with a per-list sequence number (the list "version"). Clients remember the
+last version they saw and ask for everything after it, which is an indexed range
+scan on (list_id, seq) instead of a full read of the list's items.
+
+ORM writes are recorded automatically through mapper events. Bulk statements that
+bypass the ORM must call record_changes() themselves.
+
+record_changes() also keeps the list's denormalized counters (see counters.py):
+one UPDATE of the shopping_list row moves item_count, open_item_count, version
+and updated_at in the writer's transaction. The increments are relative, so
+concurrent writers never lose one, and the row lock they take hands out the
+sequence numbers one writer at a time.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, select, insert, update, inspect
+from sqlalchemy.orm import object_session
+
+from .models import db, ListChange, ListItem, ShoppingList, User
+
+CHANGE_ADDED = 'added'
+CHANGE_UPDATED = 'updated'
+CHANGE_DELETED = 'deleted'
+
+# Columns whose modification is reported to clients as an 'updated' change
+TRACKED_ITEM_COLUMNS = ('item_name', 'category', 'is_purchased')
+
+
+# How each kind of change moves a list's item_count, per item
+ITEM_COUNT_DELTA = {CHANGE_ADDED: 1, CHANGE_UPDATED: 0, CHANGE_DELETED: -1}
+
+
+def current_version(list_id, connection=None):
+    """Return the latest sequence number recorded for a list (0 if none), a primary key lookup."""
+    conn = connection if connection is not None else db.session
+    return conn.execute(select(ShoppingList.version).where(ShoppingList.id == list_id)).scalar() or 0
+
+
+def record_changes(list_id, item_ids, change_type, connection=None, open_delta=0):
+    """
+    Append one change entry per item id and return the list's new version.
+
+    `open_delta` is the change the write made to the list's number of
+    unpurchased items; item_count follows from `change_type`.
+    """
+    conn = connection if connection is not None else db.session.connection()
+    if not item_ids:
+        return current_version(list_id, conn)
+    if connection is None:
+        _mark_changed(db.session, list_id)
+    now = datetime.utcnow()
+    version = conn.execute(
+        update(ShoppingList).where(ShoppingList.id == list_id)
+        .values(item_count=ShoppingList.item_count + ITEM_COUNT_DELTA[change_type] * len(item_ids),
+                open_item_count=ShoppingList.open_item_count + open_delta,
+                version=ShoppingList.version + len(item_ids),
+                updated_at=now)
+        .returning(ShoppingList.version)
+    ).scalar_one() - len(item_ids)
+    rows = [
+        {'list_id': list_id, 'seq': version + offset, 'item_id': item_id,
+         'change_type': change_type, 'changed_at': now}
+        for offset, item_id in enumerate(item_ids, start=1)
+    ]
+    conn.execute(insert(ListChange), rows)
+    return version + len(rows)
+
+
+def changes_since(list_id, since):
+    """
+    Return (rows, version) for all changes of a list after version `since`.
+
+    Each row carries the change plus the item's current state (None once the item
+    is gone) and the adder's username, all fetched with a single joined query.
+    """
+    rows = db.session.execute(
+        select(ListChange.seq, ListChange.item_id, ListChange.change_type, ListItem, User.username)
+        .outerjoin(ListItem, (ListItem.id == ListChange.item_id) & (ListItem.list_id == ListChange.list_id))
+        .outerjoin(User, User.id == ListItem.added_by_id)
+        .where(ListChange.list_id == list_id, ListChange.seq > since)
+        .order_by(ListChange.seq)
+    ).all()
+    version = rows[-1].seq if rows else since
+    return rows, version
+
+
+def collapse_changes(rows):
+    """
+    Reduce a run of change rows to the net effect per item.
+
+    Returns (changed, deleted_ids) where `changed` is a list of
+    (item, adder_username, change_type) for items that still exist, and
+    `deleted_ids` are tombstones for items that no longer do.
+    """
+    first_type = {}
+    last_row = {}
+    for row in rows:
+        first_type.setdefault(row.item_id, row.change_type)
+        last_row[row.item_id] = row
+
+    changed, deleted_ids = [], []
+    for item_id, row in last_row.items():
+        if row.change_type == CHANGE_DELETED or row.ListItem is None:
+            deleted_ids.append(item_id)
+        else:
+            change_type = CHANGE_ADDED if first_type[item_id] == CHANGE_ADDED else CHANGE_UPDATED
+            changed.append((row.ListItem, row.username, change_type))
+    return changed, deleted_ids
+
+
+def _mark_changed(session, list_id):
+    # Watchers of the list are woken when the session commits (see listwatch.py)
+    if session is not None:
+        session.info.setdefault('changed_list_ids', set()).add(list_id)
+
+
+@event.listens_for(ListItem, 'after_insert')
+def _log_item_insert(mapper, connection, target):
+    _mark_changed(object_session(target), target.list_id)
+    record_changes(target.list_id, [target.id], CHANGE_ADDED, connection=connection,
+                   open_delta=0 if target.is_purchased else 1)
+
+
+@event.listens_for(ListItem, 'after_update')
+def _log_item_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in TRACKED_ITEM_COLUMNS):
+        open_delta = 0
+        if state.attrs.is_purchased.history.has_changes():
+            open_delta = -1 if target.is_purchased else 1
+        _mark_changed(object_session(target), target.list_id)
+        record_changes(target.list_id, [target.id], CHANGE_UPDATED, connection=connection, open_delta=open_delta)
+
+
+@event.listens_for(ListItem, 'after_delete')
+def _log_item_delete(mapper, connection, target):
+    _mark_changed(object_session(target), target.list_id)
+    record_changes(target.list_id, [target.id], CHANGE_DELETED, connection=connection,
+                   open_delta=0 if target.is_purchased else -1)
@@ -0,0 +1,85 @@
+"""
+Denormalized per-list counters.
+
+ShoppingList carries item_count, open_item_count, version (the highest
+list_change seq) and updated_at (the time of the last item change), so the
+dashboard and the list validators read one row instead of counting list_item
+or list_change. Every write keeps them through changelog.record_changes(),
+which the mapper events call for ORM writes and the bulk statements call
+themselves.
+
+The counter UPDATE, like the bulk deletes of archive.py, sync.py and
+clear-purchased, reads its result back with RETURNING. That needs PostgreSQL
+or SQLite 3.35 or later; MySQL has no UPDATE ... RETURNING, so init_counters()
+refuses to start the app on it rather than fail every write.
+
+Writes that bypass record_changes(), such as manual SQL, leave the counters
+behind. repair_list_counters() recomputes them for every list in one UPDATE;
+`flask repair-list-counters` runs it, and `--check` only reports the lists
+that have drifted.
+"""
+import click
+from sqlalchemy import func, or_, select, update
+
+from .models import db, ListChange, ListItem, ShoppingList
+
+
+def _expected_counters():
+    """Correlated subqueries computing a list's counters from list_item and list_change."""
+    item_count = select(func.count(ListItem.id))\
+        .where(ListItem.list_id == ShoppingList.id).scalar_subquery()
+    open_item_count = select(func.count(ListItem.id))\
+        .where(ListItem.list_id == ShoppingList.id, ListItem.is_purchased.is_(False)).scalar_subquery()
+    version = select(func.coalesce(func.max(ListChange.seq), 0))\
+        .where(ListChange.list_id == ShoppingList.id).scalar_subquery()
+    return {'item_count': item_count, 'open_item_count': open_item_count, 'version': version}
+
+
+def _drifted(expected):
+    return or_(*(getattr(ShoppingList, name) != value for name, value in expected.items()))
+
+
+def drifted_list_ids():
+    """Return the ids of the lists whose stored counters disagree with their items and change log."""
+    return db.session.scalars(select(ShoppingList.id).where(_drifted(_expected_counters()))
+                              .order_by(ShoppingList.id)).all()
+
+
+def repair_list_counters():
+    """Recompute the counters of every drifted list in one UPDATE and return the ids repaired."""
+    expected = _expected_counters()
+    last_change_at = select(func.max(ListChange.changed_at))\
+        .where(ListChange.list_id == ShoppingList.id).scalar_subquery()
+    repaired = db.session.scalars(
+        update(ShoppingList).where(_drifted(expected))
+        .values(updated_at=func.coalesce(last_change_at, ShoppingList.updated_at, ShoppingList.created_at),
+                **expected)
+        .returning(ShoppingList.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return sorted(repaired)
+
+
+def _supports_returning(dialect):
+    if dialect.name == 'sqlite':
+        # Decided by the SQLite library; the dialect only finds out on its first connection
+        return getattr(dialect.dbapi, 'sqlite_version_info', (0,)) >= (3, 35)
+    return dialect.update_returning and dialect.delete_returning
+
+
+def init_counters(app):
+    """Check that the database supports the writes' RETURNING and register `flask repair-list-counters`."""
+    with app.app_context():
+        dialect = db.engine.dialect
+    if not _supports_returning(dialect):
+        raise RuntimeError(f'{dialect.name} does not support UPDATE/DELETE ... RETURNING, which every list '
+                           'write uses; use PostgreSQL or SQLite 3.35 or later')
+
+    @app.cli.command('repair-list-counters')
+    @click.option('--check', is_flag=True, help='Only report the lists whose counters have drifted.')
+    def repair_list_counters_command(check):
+        """Recompute the item counts and versions stored on shopping lists."""
+        list_ids = drifted_list_ids() if check else repair_list_counters()
+        verb = 'drifted' if check else 'repaired'
+        click.echo(f'{len(list_ids)} lists {verb}' + (f': {", ".join(map(str, list_ids))}' if list_ids else ''))
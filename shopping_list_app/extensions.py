@@ -18,4 +18,6 @@ if os.environ.get('SERVER_NAME'):
         f"https://{os.environ.get('SERVER_NAME')}"
     ]
 
-socketio = SocketIO(cors_allowed_origins=cors_origins, async_mode='eventlet')
+# Socket.IO handlers share the HTTP session (Flask-Session stores it server side) instead of
+# keeping a private copy, so every worker sees the same logged-in user for a connection
+socketio = SocketIO(cors_allowed_origins=cors_origins, async_mode='eventlet', manage_session=False)
@@ -0,0 +1,84 @@
+"""
+Socket.IO fan-out across worker processes.
+
+With several worker processes each client is connected to only one of them, so
+an event emitted by the worker that handled a request must reach the clients of
+every other worker. python-socketio does this with a pub/sub client manager:
+every emit is delivered locally and published on a channel that all workers
+listen to. SOCKETIO_MESSAGE_QUEUE selects the backend:
+
+    redis://, rediss://       Redis (production; fakeredis for the fan-out harness)
+    kafka://, zmq+tcp://,
+    amqp:// and other kombu   handled by Flask-SocketIO itself
+    memory://name             in-process broker (tests: several servers, one process)
+
+The in-memory broker exists so that tests can run several Socket.IO servers
+without a Redis server; it does not persist or replay messages and never
+leaves the process.
+"""
+import queue
+import threading
+from urllib.parse import urlparse
+
+from socketio import PubSubManager
+
+
+class MemoryBroker:
+    """An in-process pub/sub hub: every published message goes to every subscriber of its channel."""
+
+    _brokers = {}
+    _brokers_lock = threading.Lock()
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name):
+        with cls._brokers_lock:
+            return cls._brokers.setdefault(name, cls())
+
+    def subscribe(self, channel):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers.get(channel, []).remove(subscriber)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, []))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+
+class MemoryManager(PubSubManager):
+    """Client manager on a MemoryBroker, for several Socket.IO servers in one process."""
+
+    name = 'memory'
+
+    def __init__(self, url='memory://', channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.broker = MemoryBroker.get(urlparse(url).netloc or 'default')
+        # Subscribe now so nothing published before the listener starts is missed
+        self.subscription = None if write_only else self.broker.subscribe(channel)
+
+    def _publish(self, data):
+        # Serialize like a real backend so receivers never share objects with the sender
+        self.broker.publish(self.channel, self.json.dumps(data))
+
+    def _listen(self):
+        while True:
+            yield self.subscription.get()
+
+
+def create_client_manager(url, channel='flask-socketio', write_only=False):
+    """Return the client manager for the brokers defined here, or None to let Flask-SocketIO choose."""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryManager(url, channel=channel, write_only=write_only)
+    return None
@@ -0,0 +1,88 @@
+"""
+Identity cache for Flask-Login.
+
+load_identity() backs the login manager's user_loader, which runs on every
+authenticated request and Socket.IO handshake. It returns a SessionUser, a
+compact detached record of the few User fields requests read (id, username,
+favorite_list_id), from a per-app TTL cache, querying only on a miss.
+
+SessionUser is read-only: write to the user table with an UPDATE and call
+invalidate_identity(). ORM writes to User (registration, set_password) are
+invalidated automatically once they are committed. The cache is per process,
+so other workers may serve a changed favorite for up to IDENTITY_CACHE_TTL.
+"""
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .cache import get_app_cache
+from .models import db, User
+
+
+class SessionUser(UserMixin):
+    """The cached, read-only view of the logged-in User."""
+
+    def __init__(self, id, username, favorite_list_id):
+        self.id = id
+        self.username = username
+        self.favorite_list_id = favorite_list_id
+
+    def __repr__(self):
+        return f'<SessionUser {self.id} {self.username!r}>'
+
+
+def _identity_cache():
+    return get_app_cache('identity',
+                         maxsize=current_app.config.get('IDENTITY_CACHE_SIZE', 10000),
+                         ttl=current_app.config.get('IDENTITY_CACHE_TTL', 60))
+
+
+def load_identity(user_id):
+    """Return the SessionUser for `user_id`, or None if there is no such user."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    cache = _identity_cache()
+    identity = cache.get(user_id)
+    if identity is None:
+        row = db.session.execute(
+            select(User.id, User.username, User.favorite_list_id).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        identity = SessionUser(row.id, row.username, row.favorite_list_id)
+        cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(*user_ids):
+    """Forget the cached identities of the given users."""
+    cache = _identity_cache()
+    for user_id in user_ids:
+        cache.pop(user_id)
+
+
+# ORM writes to a user are invalidated after commit, so a concurrent request cannot
+# re-cache the old row between the flush and the commit.
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _remember_written_user(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('written_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_users(session):
+    user_ids = session.info.pop('written_user_ids', None)
+    if user_ids and has_app_context():
+        invalidate_identity(*user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_written_users(session):
+    session.info.pop('written_user_ids', None)
@@ -0,0 +1,88 @@
+"""
+Wake-ups for clients waiting on a list's next version.
+
+The long-poll mode of /api/list/<id>/updates (wait=) and the server-sent
+events stream /api/list/<id>/events park their greenlet on a per-list
+eventlet Event instead of polling the database. Every commit that records
+changes to a list (see changelog.py) fires that list's event, waking only the
+requests watching it.
+
+Events are per process. Changes committed by another worker are noticed by
+re-reading the list version every UPDATES_WAIT_RECHECK seconds, a single
+indexed lookup.
+
+The same commit hook drops the changed lists' cached snapshots (snapshots.py).
+"""
+import threading
+import time
+
+from eventlet.event import Event
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .changelog import current_version
+from .models import db
+from .snapshots import invalidate_list_snapshots
+
+
+class ListWatchers:
+    """One eventlet Event per watched list, replaced each time it fires."""
+
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def event_for(self, list_id):
+        with self._lock:
+            watched = self._events.get(list_id)
+            if watched is None:
+                watched = self._events[list_id] = Event()
+            return watched
+
+    def notify(self, list_id):
+        with self._lock:
+            watched = self._events.pop(list_id, None)
+        if watched is not None:
+            watched.send()
+
+
+def get_list_watchers(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('shopping_list_watchers', ListWatchers())
+
+
+def wait_for_version(list_id, since, timeout):
+    """
+    Wait up to `timeout` seconds for the list's version to pass `since`; return the version.
+
+    The session is closed before waiting so that an idle watcher holds no
+    database connection.
+    """
+    watchers = get_list_watchers()
+    recheck = current_app.config.get('UPDATES_WAIT_RECHECK', 5.0)
+    deadline = time.monotonic() + timeout
+    while True:
+        # Take the event before reading the version, so a commit in between still wakes us
+        watched = watchers.event_for(list_id)
+        version = current_version(list_id)
+        db.session.close()
+        remaining = deadline - time.monotonic()
+        if version > since or remaining <= 0:
+            return version
+        watched.wait(timeout=min(recheck, remaining))
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_list_watchers(session):
+    list_ids = session.info.pop('changed_list_ids', None)
+    if list_ids and has_app_context():
+        watchers = get_list_watchers()
+        for list_id in list_ids:
+            invalidate_list_snapshots(list_id)
+            watchers.notify(list_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_lists(session):
+    session.info.pop('changed_list_ids', None)
@@ -0,0 +1,43 @@
+"""
+Leveled, sampled application logging.
+
+Hot paths log at DEBUG. Those records are sampled at LOG_SAMPLE_RATE so that
+turning DEBUG on in production does not flood the output (and block the eventlet
+hub on every request); INFO and above are always emitted.
+
+The sampled handler is only a fallback for a process whose logging nobody has
+configured. When the host sets up handlers (gunicorn's --log-config, dictConfig,
+pytest), the records propagate to them unchanged and the host's own levels and
+filters apply.
+"""
+import logging
+import random
+
+LOGGER_NAME = 'shopping_list_app'
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a `rate` fraction of the records at or below `max_level`."""
+
+    def __init__(self, rate=1.0, max_level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or random.random() < self.rate
+
+
+def configure_logging(app):
+    """Set the package logger's level and attach a sampled handler if no handler is configured."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handler.sampled = True
+        logger.addHandler(handler)
+    for handler in logger.handlers:
+        if getattr(handler, 'sampled', False):
+            handler.filters = [SamplingFilter(app.config.get('LOG_SAMPLE_RATE', 0.01))]
+    return logger
@@ -0,0 +1,260 @@
+"""
+Request, SQL and Socket.IO instrumentation.
+
+init_metrics() installs request hooks that time every request per endpoint and
+count the SQL statements it runs (through engine events), and adds a /metrics
+endpoint serving everything in the Prometheus text format. Socket.IO emits are
+counted per event by realtime.emit_to_list(), and the outbox dispatcher reports
+how long events waited before being emitted and how many messages coalescing
+saved; the number of list rooms, their members, the largest room and the
+distribution of room sizes (over fixed buckets) are read from realtime's room
+registry at scrape time. Nothing is labelled by list or room, as every list
+would otherwise add series that are never dropped.
+
+/metrics answers only scrapers sending `Authorization: Bearer <METRICS_TOKEN>`;
+without a METRICS_TOKEN it is not served at all.
+
+The registry is stored per application in app.extensions, like the caches.
+"""
+import bisect
+import hmac
+import threading
+import time
+from collections import defaultdict
+
+from flask import abort, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+from .models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Upper bounds of the room size distribution: a fixed set of series however many lists there are
+ROOM_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Statements run outside a request (background jobs, CLI commands)
+NO_ENDPOINT = 'none'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Thread-safe store of the application's counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.requests = defaultdict(int)
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.emits = defaultdict(int)
+        self.joins_denied = 0
+        self.outbox_dispatched = 0
+        self.list_events = 0
+        self.list_messages = 0
+        self.outbox_lag = Histogram(LATENCY_BUCKETS)
+
+    def observe_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        with self._lock:
+            self.request_latency[(endpoint, method)].observe(seconds)
+            self.requests[(endpoint, method, status)] += 1
+            self.sql_statements[endpoint] += statements
+            self.sql_seconds[endpoint] += sql_seconds
+
+    def observe_sql(self, endpoint, seconds):
+        with self._lock:
+            self.sql_statements[endpoint] += 1
+            self.sql_seconds[endpoint] += seconds
+
+    def observe_emit(self, event_name):
+        with self._lock:
+            self.emits[event_name] += 1
+
+    def observe_join_denied(self):
+        with self._lock:
+            self.joins_denied += 1
+
+    def observe_coalesced(self, events, messages):
+        """Record `events` list events sent to the rooms in `messages` coalesced messages."""
+        with self._lock:
+            self.list_events += events
+            self.list_messages += messages
+
+    def observe_outbox(self, lags):
+        """Record a dispatched outbox batch by the seconds each event waited in the outbox."""
+        with self._lock:
+            self.outbox_dispatched += len(lags)
+            for lag in lags:
+                self.outbox_lag.observe(lag)
+
+    def render(self, room_sizes=None):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += ['# HELP http_request_duration_seconds Request latency per endpoint.',
+                      '# TYPE http_request_duration_seconds histogram']
+            for (endpoint, method), histogram in sorted(self.request_latency.items()):
+                labels = _labels(endpoint=endpoint, method=method)
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, method=method, le=le)} {count}')
+                lines.append(f'http_request_duration_seconds_sum{labels} {histogram.sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{labels} {histogram.count}')
+
+            lines += ['# HELP http_requests_total Requests per endpoint and status.',
+                      '# TYPE http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            lines += ['# HELP db_statements_total SQL statements executed per endpoint.',
+                      '# TYPE db_statements_total counter']
+            for endpoint, count in sorted(self.sql_statements.items()):
+                lines.append(f'db_statements_total{_labels(endpoint=endpoint)} {count}')
+
+            lines += ['# HELP db_statement_duration_seconds_total Time spent in SQL statements per endpoint.',
+                      '# TYPE db_statement_duration_seconds_total counter']
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'db_statement_duration_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}')
+
+            lines += ['# HELP socketio_emits_total Socket.IO events emitted to list rooms per event.',
+                      '# TYPE socketio_emits_total counter']
+            for event_name, count in sorted(self.emits.items()):
+                lines.append(f'socketio_emits_total{_labels(event=event_name)} {count}')
+
+            lines += ['# HELP realtime_list_events_total List events delivered in coalesced messages.',
+                      '# TYPE realtime_list_events_total counter',
+                      f'realtime_list_events_total {self.list_events}',
+                      '# HELP realtime_messages_sent_total Coalesced list_delta messages sent to list rooms.',
+                      '# TYPE realtime_messages_sent_total counter',
+                      f'realtime_messages_sent_total {self.list_messages}',
+                      '# HELP realtime_messages_saved_total Messages saved by coalescing (events minus messages sent).',
+                      '# TYPE realtime_messages_saved_total counter',
+                      f'realtime_messages_saved_total {self.list_events - self.list_messages}']
+
+            lines += ['# HELP outbox_events_dispatched_total Outbox events emitted by this process.',
+                      '# TYPE outbox_events_dispatched_total counter',
+                      f'outbox_events_dispatched_total {self.outbox_dispatched}',
+                      '# HELP outbox_delivery_lag_seconds Time from enqueueing an event to emitting it.',
+                      '# TYPE outbox_delivery_lag_seconds histogram']
+            for bound, count in self.outbox_lag.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'outbox_delivery_lag_seconds_bucket{_labels(le=le)} {count}')
+            lines.append(f'outbox_delivery_lag_seconds_sum {self.outbox_lag.sum:.6f}')
+            lines.append(f'outbox_delivery_lag_seconds_count {self.outbox_lag.count}')
+
+            lines += ['# HELP socketio_room_joins_denied_total Room joins refused by the access check.',
+                      '# TYPE socketio_room_joins_denied_total counter',
+                      f'socketio_room_joins_denied_total {self.joins_denied}']
+
+        room_sizes = room_sizes or {}
+        lines += ['# HELP socketio_rooms List rooms with members in this process.',
+                  '# TYPE socketio_rooms gauge',
+                  f'socketio_rooms {len(room_sizes)}',
+                  '# HELP socketio_room_members Connected clients in the list rooms of this process.',
+                  '# TYPE socketio_room_members gauge',
+                  f'socketio_room_members {sum(room_sizes.values())}',
+                  '# HELP socketio_room_members_max Connected clients in the largest list room of this process.',
+                  '# TYPE socketio_room_members_max gauge',
+                  f'socketio_room_members_max {max(room_sizes.values(), default=0)}',
+                  '# HELP socketio_rooms_by_size List rooms of this process with at most `le` connected clients.',
+                  '# TYPE socketio_rooms_by_size gauge']
+        distribution = Histogram(ROOM_SIZE_BUCKETS)
+        for size in room_sizes.values():
+            distribution.observe(size)
+        for bound, count in distribution.cumulative():
+            le = '+Inf' if bound == float('inf') else str(bound)
+            lines.append(f'socketio_rooms_by_size{_labels(le=le)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def get_metrics(app=None):
+    """Return the metrics registry of `app` (the current app by default)."""
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('shopping_list_metrics', MetricsRegistry())
+
+
+def room_sizes(app):
+    """Return {room: member count} for the list rooms joined in this process."""
+    members = app.extensions.get('shopping_list_room_members')
+    return members.sizes() if members is not None else {}
+
+
+def record_emit(event_name):
+    if has_app_context():
+        get_metrics().observe_emit(event_name)
+
+
+def init_metrics(app):
+    """Install the request timing hooks, the SQL statement counters and /metrics."""
+    registry = get_metrics(app)
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started_at = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        started_at = g.pop('metrics_started_at', None)
+        if started_at is not None:
+            registry.observe_request(request.endpoint or NO_ENDPOINT, request.method, response.status_code,
+                                     time.perf_counter() - started_at,
+                                     g.pop('sql_statements', 0), g.pop('sql_seconds', 0.0))
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _record_statement(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['metrics_started_at'].pop()
+        # Statements of a request are added to its totals when the request ends
+        if has_request_context() and 'metrics_started_at' in g:
+            g.sql_statements += 1
+            g.sql_seconds += seconds
+        else:
+            registry.observe_sql(NO_ENDPOINT, seconds)
+
+    @event.listens_for(engine, 'handle_error')
+    def _drop_statement_timer(context):
+        if context.connection is not None and context.connection.info.get('metrics_started_at'):
+            context.connection.info['metrics_started_at'].pop()
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return 'Unauthorized', 401
+        return registry.render(room_sizes(app)), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -1,7 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from .passwords import hash_password, verify_password
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -20,10 +20,10 @@ class User(UserMixin, db.Model):
     favorite_list = db.relationship('ShoppingList', foreign_keys=[favorite_list_id])
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 
 class ShoppingList(db.Model):
@@ -32,8 +32,15 @@ class ShoppingList(db.Model):
     name = db.Column(db.String(100), nullable=False)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized from list_item and list_change by every write (see counters.py)
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    open_item_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Highest list_change.seq
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Time of the last item change
     items = db.relationship('ListItem', backref='list', lazy=True, cascade="all, delete-orphan")
     shares = db.relationship('ListShare', backref='list', lazy=True, cascade="all, delete-orphan")
+    # Serves the dashboard's "lists owned by user, newest first"
+    __table_args__ = (db.Index('ix_shopping_list_owner_id_created_at', 'owner_id', 'created_at'),)
 
 
 class ListItem(db.Model):
@@ -41,10 +48,33 @@ class ListItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     list_id = db.Column(db.Integer, db.ForeignKey('shopping_list.id'), nullable=False)
     item_name = db.Column(db.String(200), nullable=False)
-    category = db.Column(db.String(100), nullable=True, default='Other') # New field
+    category = db.Column(db.String(100), nullable=False, default='Other') # Part of the pagination key, so never NULL
     is_purchased = db.Column(db.Boolean, default=False, nullable=False)
     added_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    purchased_at = db.Column(db.DateTime)  # When the item was ticked off; NULL while it is open (see archive.py)
+    # Serve "items of a list in the order they were added", per-list counts, and the
+    # keyset pagination of pagination.py; the last two find the items due for archival (archive.py)
+    __table_args__ = (db.Index('ix_list_item_list_id_added_at', 'list_id', 'added_at'),
+                      db.Index('ix_list_item_list_id_category_added_at_id', 'list_id', 'category', 'added_at', 'id'),
+                      db.Index('ix_list_item_purchased_at', 'purchased_at'),
+                      db.Index('ix_list_item_added_at', 'added_at'))
+
+
+class ListItemArchive(db.Model):
+    __tablename__ = 'list_item_archive'  # Explicit table name
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)  # The item's id in list_item; SQLite may reuse it later
+    list_id = db.Column(db.Integer, db.ForeignKey('shopping_list.id'), nullable=False)
+    item_name = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(100), nullable=False)
+    is_purchased = db.Column(db.Boolean, nullable=False)
+    added_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    added_at = db.Column(db.DateTime)
+    purchased_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Serves a list's history, most recently archived first (see pagination.py)
+    __table_args__ = (db.Index('ix_list_item_archive_list_id_archived_at_id', 'list_id', 'archived_at', 'id'),)
 
 
 class ListShare(db.Model):
@@ -54,5 +84,42 @@ class ListShare(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     # Relationship to the shared user
     user = db.relationship('User', backref='shared_lists', lazy=True)
-    # Ensures a user can only be shared a list once
-    __table_args__ = (db.UniqueConstraint('list_id', 'user_id', name='_list_user_uc'),)
+    # Ensures a user can only be shared a list once; the user_id index serves "lists shared with user"
+    __table_args__ = (db.UniqueConstraint('list_id', 'user_id', name='_list_user_uc'),
+                      db.Index('ix_list_share_user_id', 'user_id'))
+
+
+class ListChange(db.Model):
+    __tablename__ = 'list_change'  # Explicit table name
+    id = db.Column(db.Integer, primary_key=True)
+    list_id = db.Column(db.Integer, db.ForeignKey('shopping_list.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # Per-list version, increases by one per change
+    item_id = db.Column(db.Integer, nullable=False)  # No foreign key: tombstones outlive the item
+    change_type = db.Column(db.String(20), nullable=False)  # 'added', 'updated' or 'deleted'
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # One entry per (list, seq); the backing index also serves "seq > since" range scans
+    __table_args__ = (db.UniqueConstraint('list_id', 'seq', name='_list_seq_uc'),)
+
+
+class SyncReceipt(db.Model):
+    __tablename__ = 'sync_receipt'  # Explicit table name
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    list_id = db.Column(db.Integer, db.ForeignKey('shopping_list.id'), nullable=False)
+    temp_id = db.Column(db.String(64), nullable=False)  # Client-generated id of an offline add
+    item_id = db.Column(db.Integer, nullable=False)  # The item the add created; no FK, the item may be deleted later
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # A temp_id is applied at most once per user and list, which makes queue replays idempotent
+    __table_args__ = (db.UniqueConstraint('user_id', 'list_id', 'temp_id', name='_user_list_temp_uc'),)
+
+
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_event'  # Explicit table name
+    # SQLite would otherwise hand an emptied table's ids out again, and clients drop an event whose seq they have seen
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)  # Also the event's sequence number for clients; never reused
+    list_id = db.Column(db.Integer, nullable=False)  # No FK: an event may outlive its list
+    event = db.Column(db.String(50), nullable=False)  # Socket.IO event name, e.g. 'item_added'
+    payload = db.Column(db.Text, nullable=False)  # JSON-encoded event data
+    origin_sid = db.Column(db.String(64))  # Socket.IO sid of the client that made the change; not echoed to it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,231 @@
+"""
+Transactional outbox for list events.
+
+Request handlers do not emit Socket.IO events themselves. enqueue_event() adds
+an OutboxEvent row to the request's own transaction, so an event is stored if
+and only if the change it describes is committed, and the request returns
+without waiting for the fan-out.
+
+A dispatcher greenlet per process drains the outbox in batches: the events of
+each batch are coalesced into one 'list_delta' message per list room, in
+sequence order, and the rows are deleted once emitted. A failure before the
+delete is committed leaves the rows in place to be sent again, so delivery is
+at least once; clients drop repeats by the event's `seq` (the row id, which
+is never handed out again, even on SQLite once the table has been emptied).
+
+The dispatcher is woken by every commit that enqueued events and also polls
+every OUTBOX_POLL_INTERVAL seconds, which picks up events left behind by a
+worker that stopped before draining them.
+
+Coalescing: after a wake-up the dispatcher waits REALTIME_COALESCE_WINDOW
+seconds, so that a burst of edits becomes one message per room rather than one
+per edit. Each room also gets at most REALTIME_ROOM_MAX_RATE messages per
+second from this process; the events of a room that is over its rate stay in
+the outbox and join its next message. Events are held in the table, never in
+memory, so neither delay weakens the at-least-once guarantee.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+import eventlet
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, delete, text
+from sqlalchemy.orm import Session
+
+from .metrics import get_metrics
+from .models import db, OutboxEvent
+from .realtime import emit_to_client, emit_to_list
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Coalesced message carrying a batch of events for one list
+LIST_DELTA = 'list_delta'
+
+# Postgres advisory lock held while draining, so dispatchers of different workers
+# never send batches of the same list out of order
+DISPATCH_LOCK_KEY = 0x0b7b0c
+
+
+def enqueue_event(list_id, event_name, data, origin_sid=None):
+    """
+    Add `event_name` with `data` for the list's room to the current transaction.
+
+    `origin_sid` is the Socket.IO sid of the client that made the change. That
+    client has already applied the change, so the event is not sent back to it.
+    """
+    db.session.add(OutboxEvent(list_id=list_id, event=event_name, payload=dumps(data).decode(),
+                               origin_sid=origin_sid))
+    db.session.info['outbox_pending'] = True
+
+
+class RoomThrottle:
+    """Spaces the messages sent to each list room at least `min_interval` seconds apart."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def throttled(self):
+        """Return the ids of the lists that may not be sent to yet."""
+        now = time.monotonic()
+        with self._lock:
+            for list_id in [list_id for list_id, at in self._next_allowed.items() if at <= now]:
+                del self._next_allowed[list_id]
+            return list(self._next_allowed)
+
+    def sent(self, list_id):
+        if self.min_interval > 0:
+            with self._lock:
+                self._next_allowed[list_id] = time.monotonic() + self.min_interval
+
+    def next_release(self):
+        """Return the seconds until the next throttled room may be sent to, or None."""
+        with self._lock:
+            if not self._next_allowed:
+                return None
+            return max(0.0, min(self._next_allowed.values()) - time.monotonic())
+
+
+def get_room_throttle(app=None):
+    app = app or current_app._get_current_object()
+    throttle = app.extensions.get('shopping_list_room_throttle')
+    if throttle is None:
+        max_rate = app.config.get('REALTIME_ROOM_MAX_RATE', 10)
+        throttle = RoomThrottle(1.0 / max_rate if max_rate else 0)
+        app.extensions['shopping_list_room_throttle'] = throttle
+    return throttle
+
+
+def dispatch_pending(limit=None):
+    """Emit one batch of outbox events and delete them; return the number of events sent."""
+    limit = limit or current_app.config.get('OUTBOX_BATCH_SIZE', 500)
+    throttle = get_room_throttle()
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            locked = db.session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'),
+                                        {'key': DISPATCH_LOCK_KEY}).scalar()
+            if not locked:
+                db.session.rollback()
+                return 0
+        query = select(OutboxEvent).order_by(OutboxEvent.id).limit(limit)
+        throttled = throttle.throttled()
+        if throttled:
+            # Rooms over their rate keep their events for their next message
+            query = query.where(OutboxEvent.list_id.not_in(throttled))
+        rows = db.session.scalars(query).all()
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        rows_by_list = {}
+        for row in rows:
+            rows_by_list.setdefault(row.list_id, []).append(row)
+        messages = 0
+        for list_id, list_rows in rows_by_list.items():
+            messages += _emit_list_delta(list_id, list_rows)
+            throttle.sent(list_id)
+
+        now = datetime.utcnow()
+        metrics = get_metrics()
+        metrics.observe_coalesced(len(rows), messages)
+        metrics.observe_outbox([(now - row.created_at).total_seconds() for row in rows if row.created_at])
+        db.session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows])))
+        db.session.commit()
+        return len(rows)
+    except Exception:
+        # The rows stay in the outbox and are sent again by the next drain
+        db.session.rollback()
+        raise
+
+
+def _emit_list_delta(list_id, rows):
+    """Send a list's events to its room, leaving out each client's own events; return the messages sent."""
+    events = [{'seq': row.id, 'event': row.event, 'data': loads(row.payload)} for row in rows]
+    origins = {row.origin_sid for row in rows if row.origin_sid}
+    emit_to_list(LIST_DELTA, {'list_id': list_id, 'events': events}, list_id, skip_sid=list(origins) or None)
+    messages = 1
+    # An originating client still needs the events other clients made in the same window
+    for sid in origins:
+        others = [event for event, row in zip(events, rows) if row.origin_sid != sid]
+        if others:
+            emit_to_client(LIST_DELTA, {'list_id': list_id, 'events': others}, sid)
+            messages += 1
+    return messages
+
+
+class OutboxDispatcher:
+    """Background greenlet that drains the outbox of one application."""
+
+    def __init__(self, app):
+        self.app = app
+        self.wakeup = threading.Event()
+        self.greenlet = None
+
+    def start(self):
+        if self.greenlet is None:
+            self.greenlet = eventlet.spawn(self._run)
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    def notify(self):
+        self.wakeup.set()
+
+    def _run(self):
+        poll_interval = self.app.config.get('OUTBOX_POLL_INTERVAL', 1.0)
+        window = self.app.config.get('REALTIME_COALESCE_WINDOW', 0.05)
+        timeout = poll_interval
+        while True:
+            if self.wakeup.wait(timeout) and window:
+                eventlet.sleep(window)  # Let the rest of a burst of edits join this batch
+            self.wakeup.clear()
+            release = self.drain()
+            timeout = poll_interval if release is None else min(poll_interval, release)
+
+    def drain(self):
+        """
+        Dispatch batches until the outbox is empty or a batch fails.
+
+        Returns the seconds until a throttled room may be sent to, or None.
+        """
+        with self.app.app_context():
+            try:
+                while dispatch_pending():
+                    pass
+            except Exception:
+                logger.exception('Outbox dispatch failed; the events will be retried')
+            return get_room_throttle().next_release()
+
+
+def get_dispatcher(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.get('shopping_list_outbox')
+
+
+def init_outbox(app):
+    """Create the app's dispatcher, started by its first request unless OUTBOX_DISPATCHER is False."""
+    dispatcher = app.extensions['shopping_list_outbox'] = OutboxDispatcher(app)
+
+    @app.before_request
+    def _start_outbox_dispatcher():
+        if dispatcher.greenlet is None and app.config.get('OUTBOX_DISPATCHER', not app.testing):
+            dispatcher.start()
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_dispatcher(session):
+    if session.info.pop('outbox_pending', False) and has_app_context():
+        dispatcher = get_dispatcher()
+        if dispatcher is not None:
+            dispatcher.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_pending_events(session):
+    session.info.pop('outbox_pending', None)
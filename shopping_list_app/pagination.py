@@ -0,0 +1,94 @@
+"""
+Keyset pagination of a list's items and of its archived items.
+
+Items are paged in (category, added_at, id) order, the order of the
+ix_list_item_list_id_category_added_at_id index; archived items newest first,
+in (archived_at, id) descending order of
+ix_list_item_archive_list_id_archived_at_id. A cursor is the key of the last
+item of a page, so fetching any page is one index range scan of `limit` rows
+however many items come before it; OFFSET would scan them all.
+
+Cursors are opaque to clients: URL-safe base64 of the JSON key.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+from .models import db, ListItem, ListItemArchive, User
+from .serialization import ITEM_TIME_FORMAT, item_to_dict
+
+ItemPage = namedtuple('ItemPage', ['items', 'next_cursor'])
+
+
+def _encode_key(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def _decode_key(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def encode_cursor(item):
+    return _encode_key([item.category, item.added_at.isoformat(), item.id])
+
+
+def decode_cursor(cursor):
+    """Return the (category, added_at, id) key of a cursor; raise ValueError if it is malformed."""
+    try:
+        category, added_at, item_id = _decode_key(cursor)
+        return str(category), datetime.fromisoformat(added_at), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def decode_archive_cursor(cursor):
+    """Return the (archived_at, id) key of a history cursor; raise ValueError if it is malformed."""
+    try:
+        archived_at, item_id = _decode_key(cursor)
+        return datetime.fromisoformat(archived_at), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def item_page(list_id, cursor=None, limit=200):
+    """Return the ItemPage of up to `limit` items after `cursor` (from the start if None)."""
+    query = (select(ListItem, User.username).join(User, User.id == ListItem.added_by_id)
+             .where(ListItem.list_id == list_id)
+             .order_by(ListItem.category, ListItem.added_at, ListItem.id)
+             .limit(limit + 1))
+    if cursor is not None:
+        query = query.where(tuple_(ListItem.category, ListItem.added_at, ListItem.id) > decode_cursor(cursor))
+    rows = db.session.execute(query).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return ItemPage([item_to_dict(item, username) for item, username in rows],
+                    encode_cursor(rows[-1][0]) if more else None)
+
+
+def archive_page(list_id, cursor=None, limit=200):
+    """Return the ItemPage of up to `limit` archived items after `cursor`, most recently archived first."""
+    query = (select(ListItemArchive, User.username).join(User, User.id == ListItemArchive.added_by_id)
+             .where(ListItemArchive.list_id == list_id)
+             .order_by(ListItemArchive.archived_at.desc(), ListItemArchive.id.desc())
+             .limit(limit + 1))
+    if cursor is not None:
+        query = query.where(tuple_(ListItemArchive.archived_at, ListItemArchive.id) < decode_archive_cursor(cursor))
+    rows = db.session.execute(query).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for item, username in rows:
+        data = item_to_dict(item, username)
+        data['id'] = item.item_id
+        data['archived_at'] = item.archived_at.strftime(ITEM_TIME_FORMAT)
+        items.append(data)
+    next_cursor = None
+    if more:
+        last = rows[-1][0]
+        next_cursor = _encode_key([last.archived_at.isoformat(), last.id])
+    return ItemPage(items, next_cursor)
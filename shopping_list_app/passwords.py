@@ -0,0 +1,56 @@
+"""
+Password hashing off the eventlet hub.
+
+PBKDF2 is deliberately slow CPU-bound work. Run directly in a request it stalls
+every greenlet of the process, including all of its websockets, for the whole
+hash. hash_password() and verify_password() hand the work to eventlet's pool of
+real OS threads (hashlib releases the GIL while it hashes) so the hub keeps
+serving other clients.
+
+PASSWORD_HASH_ITERATIONS sets the PBKDF2 work factor of new hashes; existing
+hashes keep their own until needs_rehash() reports them on the next login.
+PASSWORD_HASH_THREADS sizes eventlet's thread pool, which is shared with any
+other tpool users, and only takes effect before the pool is first used.
+"""
+from eventlet import tpool
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Set once PASSWORD_HASH_THREADS has been applied; the first application of the process sizes the pool
+_pool_sized = False
+
+
+def _iterations():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS)
+    return DEFAULT_PBKDF2_ITERATIONS
+
+
+def _offload(func, *args):
+    if has_app_context() and not current_app.config.get('PASSWORD_HASH_OFFLOAD', True):
+        return func(*args)
+    return tpool.execute(func, *args)
+
+
+def hash_password(password):
+    """Return a pbkdf2:sha256 hash of `password`, computed in a worker thread."""
+    return _offload(generate_password_hash, password, f'pbkdf2:sha256:{_iterations()}')
+
+
+def verify_password(password_hash, password):
+    """Check `password` against `password_hash` in a worker thread."""
+    return _offload(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if `password_hash` was not made with the configured method and work factor."""
+    return not password_hash.startswith(f'pbkdf2:sha256:{_iterations()}$')
+
+
+def configure_password_hashing(app):
+    """Size eventlet's thread pool from PASSWORD_HASH_THREADS, once per process."""
+    global _pool_sized
+    threads = app.config.get('PASSWORD_HASH_THREADS')
+    if threads and not _pool_sized:
+        tpool.set_num_threads(threads)
+        _pool_sized = True
@@ -0,0 +1,190 @@
+"""
+Socket.IO broadcasting to list rooms.
+
+Every client viewing a list joins the room list_<id>. Request handlers queue
+list events with outbox.enqueue_event(); the outbox dispatcher emits them
+through emit_to_list() so that they are counted per room.
+
+Joins are authorized with the cached access check of access.py, and the
+members of each room are tracked per process in a RoomMembers registry, which
+also serves the member counts of /metrics. When a list is deleted its room is
+closed on every worker. When a share is removed the user's clients are taken
+out of the room on this worker; other workers stop admitting them once their
+access cache entry expires (ACCESS_CACHE_TTL).
+
+Every client is sent a 'reconnect_hint' when it connects: the backoff its
+Socket.IO client should use for its next reconnect. The hint grows with the
+rate of connections this process is accepting, so that after a deploy or
+restart, when every open page reconnects at once, the stragglers spread out.
+"""
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .access import invalidate_list_access
+from .extensions import socketio
+from .metrics import record_emit
+from .models import ListShare
+
+
+def list_room(list_id):
+    return f'list_{list_id}'
+
+
+def emit_to_list(event_name, data, list_id, **kwargs):
+    """Emit `event_name` with `data` to everyone in the list's room."""
+    socketio.emit(event_name, data, room=list_room(list_id), **kwargs)
+    record_emit(event_name)
+
+
+def emit_to_client(event_name, data, sid):
+    """Emit `event_name` with `data` to the single client `sid`, counted with the list emits."""
+    socketio.emit(event_name, data, to=sid)
+    record_emit(event_name)
+
+
+class RoomMembers:
+    """Thread-safe registry of the clients in each list room: {list_id: {sid: user_id}}."""
+
+    def __init__(self):
+        self._members = {}
+        self._lists_of_sid = {}
+        self._lock = threading.Lock()
+
+    def add(self, list_id, sid, user_id):
+        with self._lock:
+            self._members.setdefault(list_id, {})[sid] = user_id
+            self._lists_of_sid.setdefault(sid, set()).add(list_id)
+
+    def remove(self, list_id, sid):
+        with self._lock:
+            self._discard(list_id, sid)
+
+    def remove_sid(self, sid):
+        """Forget a disconnected client; return the ids of the lists it was in."""
+        with self._lock:
+            list_ids = self._lists_of_sid.pop(sid, set())
+            for list_id in list_ids:
+                members = self._members.get(list_id)
+                if members is not None:
+                    members.pop(sid, None)
+                    if not members:
+                        del self._members[list_id]
+            return list_ids
+
+    def remove_list(self, list_id, user_id=None):
+        """Forget the members of a list (only those of `user_id`, if given); return their sids."""
+        with self._lock:
+            members = self._members.get(list_id, {})
+            sids = [sid for sid, member in members.items() if user_id is None or member == user_id]
+            for sid in sids:
+                self._discard(list_id, sid)
+            return sids
+
+    def _discard(self, list_id, sid):
+        members = self._members.get(list_id)
+        if members is not None:
+            members.pop(sid, None)
+            if not members:
+                del self._members[list_id]
+        lists = self._lists_of_sid.get(sid)
+        if lists is not None:
+            lists.discard(list_id)
+            if not lists:
+                del self._lists_of_sid[sid]
+
+    def sizes(self):
+        """Return {room: member count} for the list rooms with members in this process."""
+        with self._lock:
+            return {list_room(list_id): len(members) for list_id, members in self._members.items()}
+
+
+def get_room_members(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('shopping_list_room_members', RoomMembers())
+
+
+class ConnectRate:
+    """Counts the connections accepted in the last `window` seconds."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def record(self):
+        """Count a new connection; return the connections per second over the window."""
+        now = time.monotonic()
+        with self._lock:
+            self._times.append(now)
+            while self._times[0] < now - self.window:
+                self._times.popleft()
+            return len(self._times) / self.window
+
+
+def get_connect_rate(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('shopping_list_connect_rate', ConnectRate())
+
+
+def reconnect_hint(connect_rate=0.0):
+    """
+    Return the reconnect backoff clients should use, in milliseconds.
+
+    The base delay is RECONNECT_DELAY seconds, scaled up in proportion to how
+    far `connect_rate` (connections per second) is above RECONNECT_STORM_RATE,
+    and never above RECONNECT_DELAY_MAX. Clients randomize each delay by
+    `jitter` (a fraction of it either way).
+    """
+    config = current_app.config
+    delay_max = config.get('RECONNECT_DELAY_MAX', 30.0)
+    load = connect_rate / config.get('RECONNECT_STORM_RATE', 50.0)
+    delay = min(delay_max, config.get('RECONNECT_DELAY', 1.0) * max(1.0, load))
+    return {'delay_ms': round(delay * 1000), 'delay_max_ms': round(delay_max * 1000), 'jitter': 0.5}
+
+
+def join_list(list_id, sid, user_id):
+    socketio.server.enter_room(sid, list_room(list_id), namespace='/')
+    get_room_members().add(list_id, sid, user_id)
+
+
+def leave_list(list_id, sid):
+    socketio.server.leave_room(sid, list_room(list_id), namespace='/')
+    get_room_members().remove(list_id, sid)
+
+
+def revoke_list_room(list_id, user_id=None):
+    """Take a user's clients (or, for a deleted list, everyone) out of the list's room."""
+    room = list_room(list_id)
+    sids = get_room_members().remove_list(list_id, user_id)
+    if user_id is None:
+        socketio.server.close_room(room, namespace='/')  # Published to the other workers too
+    else:
+        for sid in sids:
+            socketio.server.leave_room(sid, room, namespace='/')
+
+
+# Removed shares are revoked once the removal is committed
+@event.listens_for(ListShare, 'after_delete')
+def _remember_removed_share(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('removed_shares', set()).add((target.list_id, target.user_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _revoke_removed_shares(session):
+    removed = session.info.pop('removed_shares', None)
+    if removed and has_app_context():
+        for list_id, user_id in removed:
+            invalidate_list_access(list_id, user_id)
+            revoke_list_room(list_id, user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_removed_shares(session):
+    session.info.pop('removed_shares', None)
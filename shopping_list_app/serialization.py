@@ -0,0 +1,82 @@
+"""
+JSON encoding of list payloads.
+
+dumps() and loads() use orjson when it is installed, several times faster than
+the standard library for the item lists the API sends, and fall back to json
+otherwise. item_to_dict() is the one serialized form of a ListItem, shared by
+the API responses, the list events and the snapshot cache; parse_item_name(),
+parse_category() and parse_item_id() are the one check of an item name, a
+category and an item id sent by a client.
+"""
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up
+    orjson = None
+
+ITEM_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+# The length of ListItem.category
+MAX_CATEGORY_LENGTH = 100
+
+# Ids past a signed 64-bit integer overflow the database driver
+MAX_ITEM_ID = 2 ** 63 - 1
+
+
+def dumps(obj):
+    """Encode `obj` as compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(body, status=200):
+    """Return a response whose body is the already encoded JSON `body`."""
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def parse_item_name(value):
+    """Return a client-sent item name without surrounding whitespace, or None unless it is a non-empty string."""
+    if not isinstance(value, str):
+        return None
+    return value.strip() or None
+
+
+def parse_category(value):
+    """Return a client-sent category, stripped, or None unless it is a non-empty string of at most 100 characters."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return value if 0 < len(value) <= MAX_CATEGORY_LENGTH else None
+
+
+def parse_item_id(value):
+    """Return a client-sent item id, or None unless it is an integer (not a bool) that can be a row id."""
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value if 0 < value <= MAX_ITEM_ID else None
+
+
+def item_to_dict(item, adder_username, change_type=None):
+    """Serialize a ListItem for the JSON API and list events."""
+    data = {
+        'id': item.id,
+        'item_name': item.item_name,
+        'category': item.category,
+        'added_by_username': adder_username,
+        'added_by_id': item.added_by_id,
+        'added_at': item.added_at.strftime(ITEM_TIME_FORMAT),
+        'is_purchased': item.is_purchased
+    }
+    if change_type:
+        data['change_type'] = change_type
+    return data
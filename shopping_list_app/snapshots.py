@@ -0,0 +1,62 @@
+"""
+Per-list cache of full list snapshots.
+
+Full fetches (updates?since=0 and the list page) are served from a
+ListSnapshot: the list's items as API dicts, oldest first, and the whole
+full-snapshot response already encoded as JSON bytes. Snapshots are keyed by
+(list_id, version), so a fetch of an unchanged list costs the version lookup
+and a copy of the cached bytes, with no item query. Commits that change a list
+drop its snapshots (see listwatch.py); changes made through other workers give
+the list a new version, which is never answered from an older snapshot.
+
+Snapshot items are shared between requests and must not be modified.
+"""
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from .cache import get_app_cache
+from .models import db, ListItem, User
+from .serialization import dumps, item_to_dict
+
+ListSnapshot = namedtuple('ListSnapshot', ['version', 'items', 'body'])
+
+
+def _snapshot_cache():
+    return get_app_cache('list_snapshot',
+                         maxsize=current_app.config.get('LIST_SNAPSHOT_CACHE_SIZE', 500),
+                         ttl=current_app.config.get('LIST_SNAPSHOT_CACHE_TTL', 300))
+
+
+def list_snapshot(list_id, version):
+    """
+    Return the ListSnapshot of a list at `version`, building it on a miss.
+
+    `version` must have been read before calling, so the items loaded are at
+    least that recent. Concurrent misses for one version share one build.
+    """
+    return _snapshot_cache().get_or_create((list_id, version), lambda: _build_snapshot(list_id, version))
+
+
+def invalidate_list_snapshots(list_id, older_than=None):
+    """Drop the cached snapshots of a list (only those before version `older_than`, if given)."""
+    _snapshot_cache().discard_where(
+        lambda key: key[0] == list_id and (older_than is None or key[1] < older_than))
+
+
+def _build_snapshot(list_id, version):
+    rows = db.session.query(ListItem, User.username).join(User, User.id == ListItem.added_by_id)\
+        .filter(ListItem.list_id == list_id).order_by(ListItem.added_at.asc()).all()
+    items = [item_to_dict(item, username) for item, username in rows]
+    body = dumps({
+        'success': True,
+        'full': True,
+        'version': version,
+        'timestamp': int(time.time() * 1000),
+        'items': items,
+        'deleted_item_ids': []
+    })
+    # Nobody asks for the older versions of this list again
+    invalidate_list_snapshots(list_id, older_than=version)
+    return ListSnapshot(version, items, body)
@@ -1,12 +1,22 @@
 // Offline Manager for Shopping List App
 
 class OfflineManager {
-    constructor(listId, currentUserId) {
+    constructor(listId, currentUserId, initialVersion = 0) {
         this.listId = listId;
         this.currentUserId = currentUserId;
         this.offlineQueue = [];
-        this.lastSyncTimestamp = Date.now();
+        // The page was rendered at initialVersion, so that is what we have seen
+        this.lastSyncVersion = initialVersion;
+        localStorage.setItem(`last_version_list_${this.listId}`, this.lastSyncVersion);
         this.isOnline = navigator.onLine;
+        // Retry backoff in ms; the server replaces it with its reconnect_hint
+        this.backoff = { delay_ms: 1000, delay_max_ms: 30000, jitter: 0.5 };
+        this.syncAttempts = 0;
+        this.updateAttempts = 0;
+        // Purchased ticks waiting to be sent, {itemId: isPurchased}, debounced into batches
+        this.pendingPurchases = new Map();
+        this.purchaseDebounceMs = 400;
+        this.purchaseAttempts = 0;
         
         // Load any existing offline queue from localStorage
         this.loadOfflineQueue();
@@ -46,7 +56,9 @@ class OfflineManager {
         
         if (isOnline) {
             this.showNotification('You are back online. Syncing changes...', 'info');
-            this.syncOfflineChanges();
+            // Every page comes back online at the same moment; spread the syncs out
+            this.retryLater(() => this.syncOfflineChanges(), 0);
+            this.retryLater(() => this.flushPurchases(), 0);
         } else {
             this.showNotification('You are offline. Changes will be saved locally and synced when you reconnect.', 'warning');
         }
@@ -132,7 +144,56 @@ class OfflineManager {
         this.updateOfflineStatusUI();
     }
     
-    // Process the offline queue when back online
+    // Register a callback that applies a server delta ({items, deleted_item_ids, full}) to the page
+    setDeltaHandler(handler) {
+        this.deltaHandler = handler;
+    }
+    
+    // The page's Socket.IO connection; its id lets the server skip echoing our own changes back
+    setSocket(socket) {
+        this.socket = socket;
+    }
+    
+    requestHeaders(headers) {
+        if (this.socket && this.socket.connected) {
+            headers['X-Socket-ID'] = this.socket.id;
+        }
+        return headers;
+    }
+    
+    // Adopt the reconnect backoff ({delay_ms, delay_max_ms, jitter}) the server asks for
+    setBackoff(hint) {
+        this.backoff = hint;
+    }
+    
+    // Randomized exponential backoff: a delay drawn up to delay_ms * 2^attempt, capped at delay_max_ms
+    backoffDelay(attempt) {
+        const ceiling = Math.min(this.backoff.delay_max_ms, this.backoff.delay_ms * Math.pow(2, attempt));
+        return Math.round(ceiling * (1 - this.backoff.jitter * Math.random()));
+    }
+    
+    // Run callback after the backoff delay for the given attempt (0: up to one base delay, fully jittered)
+    retryLater(callback, attempt) {
+        const delay = attempt === 0 ? Math.random() * this.backoff.delay_ms : this.backoffDelay(attempt);
+        setTimeout(callback, delay);
+    }
+    
+    // Catch up on changes missed while disconnected, at a random point within the base delay
+    catchUp() {
+        this.retryLater(() => this.requestUpdatesSinceLastSync(), 0);
+    }
+    
+    // Apply a server delta to the page, falling back to a reload if no handler is registered
+    applyDelta(delta) {
+        if (this.deltaHandler) {
+            this.deltaHandler(delta);
+        } else {
+            window.location.reload();
+        }
+        this.setLastSyncVersion(delta.version);
+    }
+    
+    // Send the whole offline queue to the server in one request
     async syncOfflineChanges() {
         if (!this.isOnline || this.offlineQueue.length === 0) {
             return;
@@ -142,86 +203,96 @@ class OfflineManager {
         
         // Sort by timestamp to process in order
         this.offlineQueue.sort((a, b) => a.data.timestamp - b.data.timestamp);
+        const queue = this.offlineQueue.slice();
         
-        const failedItems = [];
-        
-        for (const item of this.offlineQueue) {
-            try {
-                if (item.type === 'add') {
-                    await this.syncAddItem(item.data);
-                } else if (item.type === 'delete') {
-                    await this.syncDeleteItem(item.data);
-                }
-            } catch (error) {
-                console.error(`Failed to sync item:`, item, error);
-                failedItems.push(item);
+        let result;
+        try {
+            // temp_ids make this request safe to retry: the server never applies an add twice
+            const response = await fetch(`/api/list/${this.listId}/sync`, {
+                method: 'POST',
+                headers: this.requestHeaders({
+                    'Content-Type': 'application/json',
+                    'X-Requested-With': 'XMLHttpRequest'
+                }),
+                body: JSON.stringify({ queue: queue, since: this.getLastSyncVersion() })
+            });
+            
+            if (!response.ok) {
+                throw new Error(`Failed to sync: ${response.statusText}`);
             }
+            result = await response.json();
+        } catch (error) {
+            console.error('Failed to sync offline queue:', error);
+            this.showNotification(`Failed to sync ${queue.length} changes. Will retry later.`, 'error');
+            this.syncAttempts += 1;
+            this.retryLater(() => this.syncOfflineChanges(), this.syncAttempts);
+            return;
         }
+        this.syncAttempts = 0;
         
-        // Update the queue with only failed items
-        this.offlineQueue = failedItems;
+        // Keep anything queued while the request was in flight
+        this.offlineQueue = this.offlineQueue.filter(item => !queue.includes(item));
         this.saveOfflineQueue();
         this.updateOfflineStatusUI();
         
-        if (failedItems.length > 0) {
-            this.showNotification(`Failed to sync ${failedItems.length} changes. Will retry later.`, 'error');
-        } else {
-            this.showNotification('All changes synced successfully!', 'success');
-            // Update the last sync timestamp
-            this.lastSyncTimestamp = Date.now();
-            localStorage.setItem(`last_sync_list_${this.listId}`, this.lastSyncTimestamp);
-        }
-        
-        // Refresh the page to show the latest data
-        // We could make this more elegant by just updating the UI, but a refresh is simpler
-        // and ensures everything is in sync
-        window.location.reload();
-    }
-    
-    // Sync an add item operation with the server
-    async syncAddItem(itemData) {
-        const formData = new FormData();
-        formData.append('item_name', itemData.item_name);
-        formData.append('category', itemData.category);
-        
-        const response = await fetch(`/list/${this.listId}`, {
-            method: 'POST',
-            body: formData,
-            headers: {
-                'X-Requested-With': 'XMLHttpRequest'
+        // The delta contains the synced items under their real ids, so drop the temporary ones
+        Object.keys(result.id_map).forEach(tempId => {
+            const tempItem = document.getElementById(`item-${tempId}`);
+            if (tempItem) {
+                tempItem.remove();
             }
         });
+        this.applyDelta(result);
         
-        if (!response.ok) {
-            throw new Error(`Failed to add item: ${response.statusText}`);
-        }
-        
-        // Remove the temporary item from the UI
-        const tempItem = document.getElementById(`item-${itemData.temp_id}`);
-        if (tempItem) {
-            tempItem.remove();
-        }
-        
-        return await response.json();
+        this.showNotification('All changes synced successfully!', 'success');
     }
     
-    // Sync a delete item operation with the server
-    async syncDeleteItem(itemData) {
-        const formData = new FormData();
+    // Record a tick; ticks made in quick succession are sent together
+    setPurchased(itemId, isPurchased) {
+        this.pendingPurchases.set(itemId, isPurchased);
+        clearTimeout(this.purchaseTimer);
+        this.purchaseTimer = setTimeout(() => this.flushPurchases(), this.purchaseDebounceMs);
+    }
+    
+    // Send the pending ticks: one request for the items ticked off, one for those ticked back on
+    async flushPurchases() {
+        clearTimeout(this.purchaseTimer);
+        if (!this.isOnline || this.pendingPurchases.size === 0) {
+            return;
+        }
+        const pending = this.pendingPurchases;
+        this.pendingPurchases = new Map();
         
-        const response = await fetch(`/item/${itemData.item_id}/delete`, {
-            method: 'POST',
-            body: formData,
-            headers: {
-                'X-Requested-With': 'XMLHttpRequest'
+        for (const isPurchased of [true, false]) {
+            const itemIds = [...pending].filter(([, state]) => state === isPurchased).map(([itemId]) => itemId);
+            if (itemIds.length === 0) continue;
+            try {
+                const response = await fetch(`/api/list/${this.listId}/items:purchase`, {
+                    method: 'POST',
+                    headers: this.requestHeaders({
+                        'Content-Type': 'application/json',
+                        'X-Requested-With': 'XMLHttpRequest'
+                    }),
+                    body: JSON.stringify({ item_ids: itemIds, is_purchased: isPurchased })
+                });
+                if (!response.ok) {
+                    throw new Error(`Failed to update items: ${response.statusText}`);
+                }
+            } catch (error) {
+                console.error('Failed to send purchased items:', error);
+                // Keep the unsent ticks, unless the item has been ticked again since
+                for (const [itemId, state] of pending) {
+                    if (!this.pendingPurchases.has(itemId)) {
+                        this.pendingPurchases.set(itemId, state);
+                    }
+                }
+                this.purchaseAttempts += 1;
+                this.retryLater(() => this.flushPurchases(), this.purchaseAttempts);
+                return;
             }
-        });
-        
-        if (!response.ok) {
-            throw new Error(`Failed to delete item: ${response.statusText}`);
+            itemIds.forEach(itemId => pending.delete(itemId));
         }
-        
-        return await response.json();
+        this.purchaseAttempts = 0;
     }
     
     // Add an item to the UI locally (for offline mode)
@@ -344,42 +415,89 @@ class OfflineManager {
         }, 5000);
     }
     
-    // Get the last sync timestamp
-    getLastSyncTimestamp() {
-        const savedTimestamp = localStorage.getItem(`last_sync_list_${this.listId}`);
-        return savedTimestamp ? parseInt(savedTimestamp) : this.lastSyncTimestamp;
+    // Get the last list version we have seen
+    getLastSyncVersion() {
+        const savedVersion = localStorage.getItem(`last_version_list_${this.listId}`);
+        return savedVersion ? parseInt(savedVersion) : this.lastSyncVersion;
     }
     
-    // Request updates since last sync
+    // Remember the list version we are now up to date with
+    setLastSyncVersion(version) {
+        this.lastSyncVersion = version;
+        localStorage.setItem(`last_version_list_${this.listId}`, version);
+    }
+    
+    // Strong validator the server sends for this list at the given version
+    versionETag(version) {
+        return `"list-${this.listId}-v${version}"`;
+    }
+    
+    // Request changes since the last list version we have seen
     async requestUpdatesSinceLastSync() {
         if (!this.isOnline) return;
         
-        const timestamp = this.getLastSyncTimestamp();
+        const version = this.getLastSyncVersion();
+        const headers = { 'X-Requested-With': 'XMLHttpRequest' };
+        if (version > 0) {
+            // The server answers 304 without loading any items if we are already up to date
+            headers['If-None-Match'] = this.versionETag(version);
+        }
         try {
-            const response = await fetch(`/api/list/${this.listId}/updates?since=${timestamp}`, {
+            const response = await fetch(`/api/list/${this.listId}/updates?since=${version}`, {
                 method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
+                headers: headers,
+                cache: 'no-store'
             });
             
+            if (response.status === 304) {
+                this.updateAttempts = 0;
+                return;
+            }
+            
             if (!response.ok) {
                 throw new Error(`Failed to get updates: ${response.statusText}`);
             }
+            this.updateAttempts = 0;
             
             const updates = await response.json();
-            if (updates.changes && updates.changes.length > 0) {
-                this.showNotification(`Received ${updates.changes.length} updates since your last sync.`, 'info');
-                // Refresh to show the latest data
-                window.location.reload();
+            const changeCount = updates.items.length + updates.deleted_item_ids.length;
+            // A full snapshot for a non-zero version means our version is unknown to the server
+            if (changeCount > 0 || (updates.full && version > 0)) {
+                this.showNotification(`Received ${changeCount} updates since your last sync.`, 'info');
+                this.applyDelta(updates);
+            } else {
+                this.setLastSyncVersion(updates.version);
             }
             
-            // Update the last sync timestamp
-            this.lastSyncTimestamp = Date.now();
-            localStorage.setItem(`last_sync_list_${this.listId}`, this.lastSyncTimestamp);
-            
         } catch (error) {
             console.error('Failed to get updates:', error);
+            // A server that is restarting fails many requests at once; back off before asking again
+            this.updateAttempts += 1;
+            this.retryLater(() => this.requestUpdatesSinceLastSync(), this.updateAttempts);
+        }
+    }
+    
+    // Follow the list over server-sent events while the Socket.IO connection is down
+    startEventStream() {
+        if (this.eventSource || typeof EventSource === 'undefined') return;
+        
+        // Later reconnects resume from the id of the last delta, sent as Last-Event-ID
+        this.eventSource = new EventSource(`/api/list/${this.listId}/events?since=${this.getLastSyncVersion()}`);
+        this.eventSource.addEventListener('delta', (event) => {
+            const updates = JSON.parse(event.data);
+            if (updates.items.length > 0 || updates.deleted_item_ids.length > 0 || updates.full) {
+                this.applyDelta(updates);
+            } else {
+                this.setLastSyncVersion(updates.version);
+            }
+        });
+        this.eventSource.addEventListener('revoked', () => this.stopEventStream());
+    }
+    
+    stopEventStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
         }
     }
 }
@@ -0,0 +1,104 @@
+"""
+Offline queue synchronisation.
+
+A client that was offline replays its whole queue in one request. Queued adds
+carry the client's temp_id, which is stored in sync_receipt as an idempotency
+key: replaying a queue that was already (partly) applied maps those temp_ids to
+the existing items instead of inserting duplicates. Receipts belong to one user
+and one list, so a temp_id replayed against another list is applied there.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert, delete
+
+from .categorize import categorize
+from .changelog import record_changes, CHANGE_ADDED, CHANGE_DELETED
+from .models import db, ListItem, SyncReceipt
+from .serialization import parse_category, parse_item_id, parse_item_name
+
+
+def apply_offline_queue(list_id, user_id, operations):
+    """
+    Apply queued 'add' and 'delete' operations to a list in the current transaction.
+
+    Returns (id_map, added_items, deleted_ids): the temp_id -> item id mapping for
+    every add in the queue (new or previously applied), the newly inserted items,
+    and the ids of the items that were actually deleted. Raises ValueError for a
+    malformed queue; the caller commits or rolls back.
+    """
+    adds, delete_refs = [], []
+    for operation in operations:
+        data = operation.get('data') if isinstance(operation, dict) else None
+        if not isinstance(data, dict):
+            raise ValueError('Malformed queue operation')
+        if operation.get('type') == 'add':
+            item_name = parse_item_name(data.get('item_name'))
+            if item_name is None or not data.get('temp_id'):
+                raise ValueError('Queued adds need an item_name and a temp_id')
+            adds.append(dict(data, item_name=item_name))
+        elif operation.get('type') == 'delete':
+            if data.get('item_id') is None:
+                raise ValueError('Queued deletes need an item_id')
+            delete_refs.append(data['item_id'])
+        else:
+            raise ValueError(f"Unknown queue operation {operation.get('type')!r}")
+
+    # Adds applied by an earlier attempt of this queue
+    temp_ids = [str(data['temp_id']) for data in adds]
+    id_map = {}
+    if temp_ids:
+        id_map = dict(db.session.execute(
+            select(SyncReceipt.temp_id, SyncReceipt.item_id)
+            .where(SyncReceipt.user_id == user_id, SyncReceipt.list_id == list_id,
+                   SyncReceipt.temp_id.in_(temp_ids))
+        ).all())
+
+    pending = {}
+    for data in adds:
+        temp_id = str(data['temp_id'])
+        if temp_id not in id_map:
+            pending.setdefault(temp_id, data)
+
+    added_items = []
+    if pending:
+        added_at = datetime.utcnow()
+        added_items = db.session.scalars(
+            insert(ListItem).returning(ListItem, sort_by_parameter_order=True),
+            [{'item_name': data['item_name'],
+              'category': parse_category(data.get('category')) or categorize(data['item_name']),
+              'list_id': list_id,
+              'added_by_id': user_id,
+              'is_purchased': False,
+              'added_at': added_at} for data in pending.values()]
+        ).all()
+        record_changes(list_id, [item.id for item in added_items], CHANGE_ADDED, open_delta=len(added_items))
+        db.session.execute(insert(SyncReceipt), [
+            {'user_id': user_id, 'list_id': list_id, 'temp_id': temp_id,
+             'item_id': item.id, 'created_at': added_at}
+            for temp_id, item in zip(pending, added_items)
+        ])
+        id_map.update((temp_id, item.id) for temp_id, item in zip(pending, added_items))
+
+    delete_ids = set()
+    for ref in delete_refs:
+        ref = id_map.get(str(ref), ref)
+        try:
+            item_id = parse_item_id(ref if isinstance(ref, int) else int(ref))  # Bools stay bools and are refused
+        except (TypeError, ValueError):
+            continue  # A temp item that never reached the server; nothing to delete
+        if item_id is not None:  # Ids no row can have are skipped like missing items
+            delete_ids.add(item_id)
+
+    deleted_ids = []
+    if delete_ids:
+        # Items already gone (e.g. deleted by someone else) are skipped, so deletes are idempotent too
+        deleted = db.session.execute(
+            delete(ListItem)
+            .where(ListItem.list_id == list_id, ListItem.id.in_(delete_ids))
+            .returning(ListItem.id, ListItem.is_purchased)
+        ).all()
+        deleted_ids = [row.id for row in deleted]
+        record_changes(list_id, deleted_ids, CHANGE_DELETED,
+                       open_delta=-sum(1 for row in deleted if not row.is_purchased))
+
+    return id_map, added_items, deleted_ids
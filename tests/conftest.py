@@ -7,6 +7,8 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
 from shopping_list_app.app import create_app, db as _db # Renamed to avoid conflict with fixture
 from shopping_list_app.app import User # Import User for creating test users
 
@@ -84,3 +86,18 @@ def create_user_fixture(db, app):
             _db.session.commit()
             return user
     return _create_user
+
+@pytest.fixture
+def count_queries(db):
+    """Context manager factory that collects the SQL statements executed inside its block."""
+    @contextmanager
+    def _count_queries():
+        statements = []
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(_db.engine, 'before_cursor_execute', _record)
+        try:
+            yield statements
+        finally:
+            event.remove(_db.engine, 'before_cursor_execute', _record)
+    return _count_queries
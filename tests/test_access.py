@@ -0,0 +1,81 @@
+from flask import g
+
+from shopping_list_app.app import ShoppingList, ListShare, User
+from shopping_list_app.access import resolve_list_access, invalidate_list_access
+
+
+def _make_list(db, owner_name, list_name):
+    owner = User(username=owner_name, password_hash='x')
+    db.session.add(owner)
+    db.session.commit()
+    shopping_list = ShoppingList(name=list_name, owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    return owner.id, shopping_list.id
+
+
+def test_access_is_resolved_with_one_query_then_cached(app, db, count_queries):
+    owner_id, list_id = _make_list(db, 'access_owner', 'Access List')
+    with app.test_request_context():
+        with count_queries() as statements:
+            access = resolve_list_access(list_id, owner_id)
+        assert len(statements) == 1
+        assert access.is_owner and access.allowed
+        assert access.name == 'Access List'
+
+    # A later request is served from the cross-request cache
+    with app.test_request_context():
+        g.pop('list_access', None)  # The test request shares the fixture's app context
+        with count_queries() as statements:
+            assert resolve_list_access(list_id, owner_id).is_owner
+        assert statements == []
+
+
+def test_missing_list_resolves_to_none(app, db):
+    with app.test_request_context():
+        assert resolve_list_access(987654, 1) is None
+
+
+def test_share_invalidation_grants_access(app, db):
+    owner_id, list_id = _make_list(db, 'access_sharer', 'Shared Access List')
+    guest = User(username='access_guest', password_hash='x')
+    db.session.add(guest)
+    db.session.commit()
+
+    with app.test_request_context():
+        assert not resolve_list_access(list_id, guest.id).allowed
+        db.session.add(ListShare(list_id=list_id, user_id=guest.id))
+        db.session.commit()
+        # Still the memoized denial until the share is announced
+        assert not resolve_list_access(list_id, guest.id).allowed
+        invalidate_list_access(list_id, guest.id)
+        access = resolve_list_access(list_id, guest.id)
+        assert access.is_shared_with_user and not access.is_owner
+
+
+def test_denials_are_not_cached_across_requests(app, db):
+    """Another worker never announces the share, so a later request must see it without invalidation."""
+    owner_id, list_id = _make_list(db, 'access_denied_owner', 'Denied List')
+    guest = User(username='access_denied_guest', password_hash='x')
+    db.session.add(guest)
+    db.session.commit()
+
+    with app.test_request_context():
+        assert not resolve_list_access(list_id, guest.id).allowed
+    db.session.add(ListShare(list_id=list_id, user_id=guest.id))
+    db.session.commit()
+    with app.test_request_context():
+        g.pop('list_access', None)  # The test request shares the fixture's app context
+        assert resolve_list_access(list_id, guest.id).is_shared_with_user
+
+
+def test_list_invalidation_drops_all_users(app, db, count_queries):
+    owner_id, list_id = _make_list(db, 'access_deleter', 'Doomed List')
+    with app.test_request_context():
+        resolve_list_access(list_id, owner_id)
+        resolve_list_access(list_id, owner_id + 1000)
+        invalidate_list_access(list_id)
+        assert g.list_access == {}
+        with count_queries() as statements:
+            resolve_list_access(list_id, owner_id)
+        assert len(statements) == 1
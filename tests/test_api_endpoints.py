@@ -1,7 +1,10 @@
 import unittest
+from unittest.mock import patch
 import json
 import os
 import sys
+import time
+import eventlet
 from flask import Flask, session
 from flask_login import login_user
 
@@ -9,7 +12,10 @@ from flask_login import login_user
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from shopping_list_app.app import create_app
-from shopping_list_app.models import db, User, ShoppingList, ListItem
+from shopping_list_app.models import db, User, ShoppingList, ListItem, ListChange
+from shopping_list_app.changelog import changes_since
+from shopping_list_app.outbox import dispatch_pending
+from shopping_list_app import snapshots
 
 class APIEndpointTestCase(unittest.TestCase):
     def setUp(self):
@@ -115,7 +121,7 @@ class APIEndpointTestCase(unittest.TestCase):
             self.assertIsNone(deleted_item)
     
     def test_updates_since_endpoint(self):
-        """Test the API endpoint for getting updates since a timestamp"""
+        """Test the API endpoint for getting updates since a list version"""
         with self.client as c:
             # Set the session cookie to maintain login
             with c.session_transaction() as sess:
@@ -131,46 +137,433 @@ class APIEndpointTestCase(unittest.TestCase):
             db.session.add(baseline_item)
             db.session.commit()
             
-            # Get the timestamp after creating the baseline item
-            import time
-            time.sleep(0.5)  # Ensure timestamp difference
-            timestamp_ms = int(time.time() * 1000)
-            
-            # Add a new item after the timestamp
-            time.sleep(0.5)  # Ensure another timestamp difference
+            # A full fetch reports the version the client is now up to date with
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since=0')
+            self.assertEqual(response.status_code, 200)
+            version = json.loads(response.data)['version']
+            self.assertGreater(version, 0)
             
+            # Add a new item after that version
             new_item = ListItem(item_name='Yogurt', category='Dairy', list_id=self.test_list.id, added_by_id=self.user.id)
             db.session.add(new_item)
             db.session.commit()
             
-            # Make the API request with our timestamp and the test parameter
-            response = c.get(
-                f'/api/list/{self.test_list.id}/updates?since={timestamp_ms}&test_updates_endpoint=true&test_item_name=Yogurt'
-            )
+            # Make the API request with our version
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since={version}')
             
             # Check the response
             self.assertEqual(response.status_code, 200)
             data = json.loads(response.data)
             self.assertTrue(data['success'])
-            
-            # Print debug info
-            print(f"Test timestamp: {timestamp_ms/1000.0}, Items returned: {len(data['items'])}")
-            if len(data['items']) > 0:
-                for item in data['items']:
-                    print(f"Item in response: {item['item_name']}")
+            self.assertFalse(data['full'])
             
             # Should only return the new item (Yogurt) and not the baseline item
             self.assertEqual(len(data['items']), 1, f"Expected 1 new item, got {len(data['items'])}")
-            
-            # If we got an item, verify it's the right one
-            if len(data['items']) > 0:
-                self.assertEqual(data['items'][0]['item_name'], 'Yogurt')
+            self.assertEqual(data['items'][0]['item_name'], 'Yogurt')
+            self.assertEqual(data['items'][0]['change_type'], 'added')
+            self.assertEqual(data['version'], version + 1)
                 
-            # Also verify that a request with timestamp=0 returns all items
+            # Also verify that a request with since=0 returns all items
             response = c.get(f'/api/list/{self.test_list.id}/updates?since=0')
             self.assertEqual(response.status_code, 200)
             all_data = json.loads(response.data)
-            self.assertEqual(len(all_data['items']), 2, "Should return both items with timestamp=0")
+            self.assertEqual(len(all_data['items']), 2, "Should return both items with since=0")
+
+    def test_updates_since_reports_deletions_and_purchases(self):
+        """Test that the updates API returns tombstones and purchased-state changes"""
+        with self.client as c:
+            # The setUp items were bulk inserted, so log one ORM change to get a non-zero version
+            db.session.add(ListItem(item_name='Eggs', category='Dairy', list_id=self.test_list.id, added_by_id=self.user.id))
+            db.session.commit()
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since=0')
+            version = json.loads(response.data)['version']
+
+            milk = ListItem.query.filter_by(item_name='Milk').first()
+            bread = ListItem.query.filter_by(item_name='Bread').first()
+            milk_id = milk.id
+            milk.is_purchased = True
+            db.session.delete(bread)
+            db.session.commit()
+
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since={version}')
+            data = json.loads(response.data)
+            self.assertEqual(data['version'], version + 2)
+            self.assertEqual([item['id'] for item in data['items']], [milk_id])
+            self.assertEqual(data['items'][0]['change_type'], 'updated')
+            self.assertTrue(data['items'][0]['is_purchased'])
+            self.assertEqual(data['deleted_item_ids'], [bread.id])
+
+            # Nothing new since the latest version
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since={data["version"]}')
+            data = json.loads(response.data)
+            self.assertEqual(data['items'], [])
+            self.assertEqual(data['deleted_item_ids'], [])
+
+    def test_updates_since_not_modified(self):
+        """Test that a client holding the current version gets a 304 until the list changes"""
+        with self.client as c:
+            db.session.add(ListItem(item_name='Eggs', category='Dairy', list_id=self.test_list.id, added_by_id=self.user.id))
+            db.session.commit()
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since=0')
+            version = json.loads(response.data)['version']
+            etag = response.headers['ETag']
+            self.assertEqual(etag, f'"list-{self.test_list.id}-v{version}"')
+
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since={version}',
+                             headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.assertEqual(response.data, b'')
+
+            db.session.add(ListItem(item_name='Jam', category='Pantry Staples', list_id=self.test_list.id, added_by_id=self.user.id))
+            db.session.commit()
+            response = c.get(f'/api/list/{self.test_list.id}/updates?since={version}',
+                             headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertEqual([item['item_name'] for item in data['items']], ['Jam'])
+            self.assertEqual(response.headers['ETag'], f'"list-{self.test_list.id}-v{version + 1}"')
+
+    def _add_item_later(self, list_id, user_id, item_name, delay=0.05):
+        """Commit a new item from another greenlet and session after `delay` seconds"""
+        def add():
+            eventlet.sleep(delay)
+            with self.app.app_context():
+                db.session.add(ListItem(item_name=item_name, category='Other', list_id=list_id, added_by_id=user_id))
+                db.session.commit()
+        return eventlet.spawn(add)
+
+    def test_updates_long_poll_wakes_on_change(self):
+        """Test that wait= parks the request until the list's version changes"""
+        list_id, user_id = self.test_list.id, self.user.id
+        self.app.config['UPDATES_WAIT_RECHECK'] = 30  # Only the commit can wake the request in time
+        # The setUp items were bulk inserted, so log one ORM change to get a non-zero version
+        db.session.add(ListItem(item_name='Eggs', category='Dairy', list_id=list_id, added_by_id=user_id))
+        db.session.commit()
+        with self.client as c:
+            version = json.loads(c.get(f'/api/list/{list_id}/updates?since=0').data)['version']
+
+            adder = self._add_item_later(list_id, user_id, 'Cocoa')
+            started = time.monotonic()
+            response = c.get(f'/api/list/{list_id}/updates?since={version}&wait=20')
+            adder.wait()
+            self.assertLess(time.monotonic() - started, 5)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item['item_name'] for item in json.loads(response.data)['items']], ['Cocoa'])
+
+            # Nothing changes: the wait times out and the client is told it is up to date
+            etag = response.headers['ETag']
+            response = c.get(f'/api/list/{list_id}/updates?since={version + 1}&wait=0.1',
+                             headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+    def test_event_stream_sends_deltas(self):
+        """Test that the SSE stream sends a delta for each new version and keepalives in between"""
+        list_id, user_id = self.test_list.id, self.user.id
+        self.app.config.update(SSE_HEARTBEAT=0.1, SSE_MAX_DURATION=0.5, UPDATES_WAIT_RECHECK=30)
+        # The setUp items were bulk inserted, so log one ORM change to get a non-zero version
+        db.session.add(ListItem(item_name='Eggs', category='Dairy', list_id=list_id, added_by_id=user_id))
+        db.session.commit()
+        with self.client as c:
+            version = json.loads(c.get(f'/api/list/{list_id}/updates?since=0').data)['version']
+            adder = self._add_item_later(list_id, user_id, 'Tea', delay=0.2)
+            response = c.get(f'/api/list/{list_id}/events', headers={'Last-Event-ID': str(version)})
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            body = response.get_data(as_text=True)
+            adder.wait()
+
+        self.assertIn(': keepalive', body)
+        deltas = [block for block in body.split('\n\n') if 'event: delta' in block]
+        self.assertEqual(len(deltas), 1)
+        lines = dict(line.split(': ', 1) for line in deltas[0].splitlines())
+        self.assertEqual(lines['id'], str(version + 1))
+        self.assertEqual([item['item_name'] for item in json.loads(lines['data'])['items']], ['Tea'])
+
+    def test_concurrent_updates_share_one_delta(self):
+        """Test that simultaneous requests for the same delta compute it once"""
+        list_id, user_id = self.test_list.id, self.user.id
+        db.session.add(ListItem(item_name='Eggs', category='Dairy', list_id=list_id, added_by_id=user_id))
+        db.session.commit()
+        with self.client as c:
+            with c.session_transaction() as sess:
+                # The requests below run in their own greenlets, outside the login of setUp
+                sess['_user_id'] = str(user_id)
+            version = json.loads(c.get(f'/api/list/{list_id}/updates?since=0').data)['version']
+        db.session.add(ListItem(item_name='Flour', category='Baking', list_id=list_id, added_by_id=user_id))
+        db.session.commit()
+
+        calls = []
+
+        def slow_changes_since(*args):
+            calls.append(args)
+            eventlet.sleep(0.05)  # Long enough for every request to arrive while the first computes
+            return changes_since(*args)
+
+        with patch('shopping_list_app.main.changes_since', side_effect=slow_changes_since):
+            requests = [eventlet.spawn(self.client.get, f'/api/list/{list_id}/updates?since={version}')
+                        for _ in range(5)]
+            responses = [request.wait() for request in requests]
+
+        self.assertEqual(len(calls), 1)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item['item_name'] for item in json.loads(response.data)['items']], ['Flour'])
+
+    def test_full_fetch_is_served_from_the_list_snapshot(self):
+        """Test that full fetches of an unchanged list reuse the encoded snapshot until the list changes"""
+        list_id, user_id = self.test_list.id, self.user.id
+        url = f'/api/list/{list_id}/updates?since=0'
+        with self.client as c, patch('shopping_list_app.snapshots._build_snapshot',
+                                     side_effect=snapshots._build_snapshot) as build:
+            first = c.get(url)
+            second = c.get(url)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(first.data, second.data)
+            self.assertEqual(first.mimetype, 'application/json')
+            self.assertEqual({item['item_name'] for item in json.loads(first.data)['items']}, {'Milk', 'Bread'})
+
+            # The commit drops the snapshot, and the new version gets a new one
+            db.session.add(ListItem(item_name='Rice', category='Pantry Staples', list_id=list_id, added_by_id=user_id))
+            db.session.commit()
+            third = json.loads(c.get(url).data)
+            self.assertEqual(build.call_count, 2)
+            self.assertIn('Rice', [item['item_name'] for item in third['items']])
+            self.assertGreater(third['version'], json.loads(first.data)['version'])
+
+    def test_items_keyset_pagination(self):
+        """Test that following next_cursor walks every item once in (category, added_at, id) order"""
+        list_id, user_id = self.test_list.id, self.user.id
+        for name, category in [('Apples', 'Fruits'), ('Soap', 'Household'), ('Cheese', 'Dairy'),
+                               ('Pears', 'Fruits'), ('Rolls', 'Bakery')]:
+            db.session.add(ListItem(item_name=name, category=category, list_id=list_id, added_by_id=user_id))
+        db.session.commit()
+        expected = [item.item_name for item in ListItem.query.filter_by(list_id=list_id)
+                    .order_by(ListItem.category, ListItem.added_at, ListItem.id)]
+
+        with self.client as c:
+            names, cursor, pages = [], '', 0
+            while True:
+                page = json.loads(c.get(f'/api/list/{list_id}/items?limit=3&cursor={cursor}').data)
+                names += [item['item_name'] for item in page['items']]
+                pages += 1
+                if page['next_cursor'] is None:
+                    break
+                cursor = page['next_cursor']
+            self.assertEqual(names, expected)
+            self.assertEqual(pages, 3)
+
+            self.assertEqual(c.get(f'/api/list/{list_id}/items?cursor=not-a-cursor').status_code, 400)
+            self.assertEqual(c.get(f'/api/list/{list_id}/items?limit=0').status_code, 400)
+
+    def test_updates_since_invalid_version(self):
+        """Test that a non-numeric version is rejected"""
+        response = self.client.get(f'/api/list/{self.test_list.id}/updates?since=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_add_items_endpoint(self):
+        """Test that a batch of items is inserted and broadcast once"""
+        batch = [
+            {'item_name': 'Flour', 'category': 'Pantry Staples'},
+            {'item_name': 'Eggs', 'category': 'Dairy'},
+            {'item_name': 'Sugar'}
+        ]
+        response = self.client.post(f'/api/list/{self.test_list.id}/items:batch', json={'items': batch})
+        with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+            dispatch_pending()
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual([item['item_name'] for item in data['items']], ['Flour', 'Eggs', 'Sugar'])
+        self.assertEqual(data['items'][2]['category'], 'Pantry Staples')  # Categorized on the server
+        self.assertEqual(ListItem.query.filter_by(list_id=self.test_list.id).count(), 5)
+
+        # One event for the whole batch
+        mock_socketio.emit.assert_called_once()
+        name, payload = mock_socketio.emit.call_args[0]
+        self.assertEqual(name, 'list_delta')
+        self.assertEqual([event['event'] for event in payload['events']], ['items_added'])
+        self.assertEqual(len(payload['events'][0]['data']['items']), 3)
+
+        # The batch is logged as consecutive additions, in request order
+        response = self.client.get(f'/api/list/{self.test_list.id}/updates?since={data["version"] - 2}')
+        delta = json.loads(response.data)
+        self.assertEqual([item['item_name'] for item in delta['items']], ['Eggs', 'Sugar'])
+        self.assertEqual(ListChange.query.filter_by(list_id=self.test_list.id).count(), 3)
+
+    def test_purchase_rejects_ids_that_cannot_be_rows(self):
+        """Test that bools and out-of-range ids are refused with 400 instead of reaching the database"""
+        list_id = self.test_list.id
+        url = f'/api/list/{list_id}/items:purchase'
+        for bad_ids in ([True], [False], [10 ** 30], [0], [-1], [2 ** 63], ['1'], [1.5]):
+            response = self.client.post(url, json={'item_ids': bad_ids, 'is_purchased': True})
+            self.assertEqual(response.status_code, 400, bad_ids)
+        self.assertFalse(any(item.is_purchased for item in ListItem.query.filter_by(list_id=list_id)))
+
+        # Sync deletes skip such ids like items that are already gone
+        response = self.client.post(f'/api/list/{list_id}/sync', json={'queue': [
+            {'type': 'delete', 'data': {'item_id': 10 ** 30}},
+            {'type': 'delete', 'data': {'item_id': True}},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['deleted_item_ids'], [])
+
+    def test_purchase_and_clear_purchased_items(self):
+        """Test that ticks are applied in one UPDATE, broadcast as ids, and cleared with one DELETE"""
+        list_id = self.test_list.id
+        item_ids = [item.id for item in ListItem.query.filter_by(list_id=list_id).order_by(ListItem.id)]
+        url = f'/api/list/{list_id}/items:purchase'
+
+        data = json.loads(self.client.post(url, json={'item_ids': item_ids, 'is_purchased': True}).data)
+        self.assertEqual(sorted(data['item_ids']), item_ids)
+        version = data['version']
+        # Ticking them again changes nothing and logs nothing
+        data = json.loads(self.client.post(url, json={'item_ids': item_ids, 'is_purchased': True}).data)
+        self.assertEqual(data['item_ids'], [])
+        self.assertEqual(data['version'], version)
+        self.assertTrue(all(item.is_purchased for item in ListItem.query.filter_by(list_id=list_id)))
+
+        delta = json.loads(self.client.get(f'/api/list/{list_id}/updates?since={version - 2}').data)
+        self.assertEqual({item['id'] for item in delta['items'] if item['is_purchased']}, set(item_ids))
+
+        # Untick one, then clear the rest
+        self.client.post(url, json={'item_ids': item_ids[:1], 'is_purchased': False})
+        data = json.loads(self.client.post(f'/api/list/{list_id}/items:clear_purchased').data)
+        self.assertEqual(data['item_ids'], item_ids[1:])
+        self.assertEqual([item.id for item in ListItem.query.filter_by(list_id=list_id)], item_ids[:1])
+        delta = json.loads(self.client.get(f'/api/list/{list_id}/updates?since={data["version"] - 1}').data)
+        self.assertEqual(delta['deleted_item_ids'], item_ids[1:])
+
+        with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+            dispatch_pending()
+        name, payload = mock_socketio.emit.call_args[0]
+        events = [(event['event'], event['data']) for event in payload['events']]
+        self.assertEqual(events, [
+            ('items_purchased', {'item_ids': data_ids, 'is_purchased': state, 'list_id': list_id})
+            for data_ids, state in ((sorted(item_ids), True), (item_ids[:1], False))
+        ] + [('items_deleted', {'item_ids': item_ids[1:], 'list_id': list_id})])
+
+        self.assertEqual(self.client.post(url, json={'item_ids': item_ids}).status_code, 400)
+        self.assertEqual(self.client.post(url, json={'item_ids': [], 'is_purchased': True}).status_code, 400)
+
+    def test_batch_add_items_validation(self):
+        """Test that invalid batches are rejected without inserting anything"""
+        response = self.client.post(f'/api/list/{self.test_list.id}/items:batch',
+                                    json={'items': [{'item_name': 'Ok'}, {'category': 'Dairy'}]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/api/list/{self.test_list.id}/items:batch', json={'items': []})
+        self.assertEqual(response.status_code, 400)
+
+        self.app.config['BATCH_ITEM_LIMIT'] = 2
+        response = self.client.post(f'/api/list/{self.test_list.id}/items:batch',
+                                    json=[{'item_name': 'A'}, {'item_name': 'B'}, {'item_name': 'C'}])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(ListItem.query.filter_by(list_id=self.test_list.id).count(), 2)
+
+    def test_item_names_must_be_non_empty_strings(self):
+        """Test that numbers, blanks and other non-names are rejected with 400 by every add path"""
+        list_id = self.test_list.id
+        before = ListItem.query.filter_by(list_id=list_id).count()
+        for bad_name in (42, '   ', None, ['Milk'], {'name': 'Milk'}):
+            response = self.client.post(f'/api/list/{list_id}/add_item', json={'item_name': bad_name})
+            self.assertEqual(response.status_code, 400, bad_name)
+            response = self.client.post(f'/api/list/{list_id}/items:batch',
+                                        json={'items': [{'item_name': 'Ok'}, {'item_name': bad_name}]})
+            self.assertEqual(response.status_code, 400, bad_name)
+            response = self.client.post(f'/api/list/{list_id}/sync', json={'queue': [
+                {'type': 'add', 'data': {'item_name': bad_name, 'temp_id': 'temp_bad'}}
+            ]})
+            self.assertEqual(response.status_code, 400, bad_name)
+        self.assertEqual(ListItem.query.filter_by(list_id=list_id).count(), before)
+
+        # Surrounding whitespace is dropped
+        data = json.loads(self.client.post(f'/api/list/{list_id}/add_item', json={'item_name': '  Eggs '}).data)
+        self.assertEqual(data['item']['item_name'], 'Eggs')
+
+    def test_invalid_categories_fall_back_to_categorize(self):
+        """Test that a category that is not a short non-empty string is replaced by the server's categorization"""
+        list_id = self.test_list.id
+        for bad_category in ({'a': 1}, 5, '  ', 'x' * 101, ['Dairy']):
+            response = self.client.post(f'/api/list/{list_id}/add_item',
+                                        json={'item_name': 'Milk', 'category': bad_category})
+            self.assertEqual(response.status_code, 200, bad_category)
+            self.assertEqual(json.loads(response.data)['item']['category'], 'Dairy')
+            response = self.client.post(f'/api/list/{list_id}/items:batch',
+                                        json={'items': [{'item_name': 'x', 'category': bad_category}]})
+            self.assertEqual(response.status_code, 200, bad_category)
+            self.assertEqual(json.loads(response.data)['items'][0]['category'], 'Other')
+            temp_id = f'temp_category_{len(str(bad_category))}_{type(bad_category).__name__}'
+            response = self.client.post(f'/api/list/{list_id}/sync', json={'queue': [
+                {'type': 'add', 'data': {'item_name': 'Milk', 'category': bad_category, 'temp_id': temp_id}}
+            ]})
+            self.assertEqual(response.status_code, 200, bad_category)
+            item = ListItem.query.get(json.loads(response.data)['id_map'][temp_id])
+            self.assertEqual(item.category, 'Dairy')
+
+        data = json.loads(self.client.post(f'/api/list/{list_id}/add_item',
+                                           json={'item_name': 'Milk', 'category': ' Bakery '}).data)
+        self.assertEqual(data['item']['category'], 'Bakery')
+
+    def test_sync_offline_queue_is_idempotent(self):
+        """Test that replaying an offline queue never duplicates items"""
+        milk = ListItem.query.filter_by(item_name='Milk').first()
+        milk_id = milk.id
+        queue = [
+            {'type': 'add', 'data': {'item_name': 'Apples', 'category': 'Fruits', 'temp_id': 'temp_1'}},
+            {'type': 'add', 'data': {'item_name': 'Carrots', 'category': 'Vegetables', 'temp_id': 'temp_2'}},
+            {'type': 'delete', 'data': {'item_id': milk_id}}
+        ]
+
+        response = self.client.post(f'/api/list/{self.test_list.id}/sync', json={'queue': queue, 'since': 0})
+        with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+            dispatch_pending()
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(set(data['id_map']), {'temp_1', 'temp_2'})
+        self.assertIsNone(ListItem.query.get(milk_id))
+        payload = mock_socketio.emit.call_args[0][1]
+        self.assertEqual([event['event'] for event in payload['events']], ['items_added', 'items_deleted'])
+        # since=0 returns the full resulting list
+        self.assertTrue(data['full'])
+        self.assertEqual(sorted(item['item_name'] for item in data['items']), ['Apples', 'Bread', 'Carrots'])
+
+        # A retry of the same queue (e.g. after a lost response) maps to the same items
+        response = self.client.post(f'/api/list/{self.test_list.id}/sync', json={'queue': queue, 'since': data['version']})
+        retry = json.loads(response.data)
+        self.assertEqual(retry['id_map'], data['id_map'])
+        self.assertEqual(retry['version'], data['version'])
+        self.assertEqual(retry['items'], [])
+        self.assertEqual(ListItem.query.filter_by(list_id=self.test_list.id).count(), 3)
+
+    def test_sync_offline_queue_validation(self):
+        """Test that malformed queues are rejected as a whole"""
+        queue = [
+            {'type': 'add', 'data': {'item_name': 'Apples', 'temp_id': 'temp_1'}},
+            {'type': 'rename', 'data': {}}
+        ]
+        response = self.client.post(f'/api/list/{self.test_list.id}/sync', json={'queue': queue})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/api/list/{self.test_list.id}/sync', json={'items': []})
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(ListItem.query.filter_by(item_name='Apples').first())
+
+    def test_sync_receipts_are_scoped_to_their_list(self):
+        """Test that a temp_id replayed against another list adds the item there instead of reusing the first one"""
+        other_list = ShoppingList(name='Other List', owner_id=self.user.id)
+        db.session.add(other_list)
+        db.session.commit()
+        queue = [{'type': 'add', 'data': {'item_name': 'Apples', 'temp_id': 'temp_shared'}}]
+
+        first = json.loads(self.client.post(f'/api/list/{self.test_list.id}/sync', json={'queue': queue}).data)
+        second = json.loads(self.client.post(f'/api/list/{other_list.id}/sync', json={'queue': queue}).data)
+        self.assertNotEqual(second['id_map']['temp_shared'], first['id_map']['temp_shared'])
+        self.assertEqual(db.session.get(ListItem, second['id_map']['temp_shared']).list_id, other_list.id)
+        self.assertEqual(ListItem.query.filter_by(list_id=other_list.id, item_name='Apples').count(), 1)
+
+        # Each list still applies the temp_id only once
+        retry = json.loads(self.client.post(f'/api/list/{other_list.id}/sync', json={'queue': queue}).data)
+        self.assertEqual(retry['id_map'], second['id_map'])
+        self.assertEqual(ListItem.query.filter_by(list_id=other_list.id, item_name='Apples').count(), 1)
 
 if __name__ == '__main__':
     unittest.main()
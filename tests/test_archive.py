@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+from flask import url_for
+
+from shopping_list_app.app import ShoppingList, User
+from shopping_list_app.archive import archive_batch
+from shopping_list_app.models import ListItem, ListItemArchive, OutboxEvent
+from shopping_list_app.serialization import loads
+
+
+def test_archive_moves_due_items_in_batches_and_logs_tombstones(auth_client_fixture, app, db):
+    authed_client = auth_client_fixture(username='archiveuser')
+    user = db.session.query(User).filter_by(username='archiveuser').first()
+    shopping_list = ShoppingList(name='Archive List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+
+    now = datetime.utcnow()
+    items = {
+        'fresh': ListItem(item_name='Fresh', added_at=now),
+        'old': ListItem(item_name='Old', added_at=now - timedelta(days=200)),
+        'bought_long_ago': ListItem(item_name='Bought', added_at=now, is_purchased=True,
+                                    purchased_at=now - timedelta(hours=30)),
+        'bought_just_now': ListItem(item_name='Ticked', added_at=now, is_purchased=True, purchased_at=now),
+    }
+    for item in items.values():
+        item.list_id, item.added_by_id = list_id, user.id
+        item.category = 'Other'
+        db.session.add(item)
+    db.session.commit()
+    ids = {name: item.id for name, item in items.items()}
+    version = authed_client.get(url_for('main.get_list_updates_since', list_id=list_id)).get_json()['version']
+
+    # By default only purchased items are archived; old open items stay on the list
+    assert archive_batch(limit=1) == 1
+    assert archive_batch(limit=1) == 0
+    app.config['ARCHIVE_ITEM_MAX_AGE'] = 180
+    try:
+        assert archive_batch(limit=1) == 1
+        assert archive_batch(limit=1) == 0
+    finally:
+        app.config['ARCHIVE_ITEM_MAX_AGE'] = 0
+
+    archived = {ids['old'], ids['bought_long_ago']}
+    remaining = {item.id for item in db.session.query(ListItem).filter_by(list_id=list_id)}
+    assert remaining == {ids['fresh'], ids['bought_just_now']}
+    rows = db.session.query(ListItemArchive).filter_by(list_id=list_id).all()
+    assert {row.item_id for row in rows} == archived
+    assert all(row.archived_at is not None and row.added_by_id == user.id for row in rows)
+
+    delta = authed_client.get(url_for('main.get_list_updates_since', list_id=list_id, since=version)).get_json()
+    assert sorted(delta['deleted_item_ids']) == sorted(archived)
+    events = db.session.query(OutboxEvent).filter_by(list_id=list_id, event='items_deleted').all()
+    assert sorted(item_id for event in events for item_id in loads(event.payload)['item_ids']) == sorted(archived)
+
+
+def test_history_pages_archived_items_newest_first(auth_client_fixture, app, db):
+    authed_client = auth_client_fixture(username='historyuser')
+    user = db.session.query(User).filter_by(username='historyuser').first()
+    shopping_list = ShoppingList(name='History List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+    for name in ('Eggs', 'Flour', 'Sugar'):
+        authed_client.post(url_for('main.api_add_item', list_id=list_id), json={'item_name': name})
+    item_ids = sorted(item.id for item in db.session.query(ListItem).filter_by(list_id=list_id))
+
+    # Ticking an item off stamps purchased_at; it is archived once ARCHIVE_PURCHASED_AFTER has passed
+    authed_client.post(url_for('main.api_set_items_purchased', list_id=list_id),
+                       json={'item_ids': item_ids[:2], 'is_purchased': True})
+    archive_batch()
+    assert db.session.query(ListItemArchive).filter_by(list_id=list_id).count() == 0
+    purchased = db.session.query(ListItem).filter(ListItem.id.in_(item_ids[:2])).all()
+    assert all(item.purchased_at is not None for item in purchased)
+    for item in purchased:
+        item.purchased_at -= timedelta(hours=25)
+    db.session.commit()
+    while archive_batch():
+        pass
+    assert sorted(row.item_id for row in db.session.query(ListItemArchive).filter_by(list_id=list_id)) == item_ids[:2]
+
+    url = url_for('main.api_list_history', list_id=list_id)
+    first = authed_client.get(url, query_string={'limit': 1}).get_json()
+    assert [item['id'] for item in first['items']] == [item_ids[1]]
+    assert first['items'][0]['is_purchased'] and first['items'][0]['added_by_username'] == 'historyuser'
+    second = authed_client.get(url, query_string={'limit': 1, 'cursor': first['next_cursor']}).get_json()
+    assert [item['id'] for item in second['items']] == [item_ids[0]]
+    assert second['next_cursor'] is None
+    assert authed_client.get(url, query_string={'cursor': 'not-a-cursor'}).status_code == 400
+
+    authed_client.post(url_for('main.delete_list', list_id=list_id))
+    assert db.session.query(ListItemArchive).filter_by(list_id=list_id).count() == 0
+
+
+def test_archive_keeps_working_when_an_item_id_is_reused(app, db):
+    """SQLite gives the next item the id of a deleted highest row; the archive must not clash on it."""
+    owner = User(username='archivereuse')
+    owner.set_password('password')
+    db.session.add(owner)
+    db.session.commit()
+    shopping_list = ShoppingList(name='Reuse List', owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+
+    long_ago = datetime.utcnow() - timedelta(hours=30)
+    first = ListItem(item_name='Butter', category='Dairy', list_id=list_id, added_by_id=owner.id,
+                     is_purchased=True, purchased_at=long_ago)
+    db.session.add(first)
+    db.session.commit()
+    reused_id = first.id
+    while archive_batch():
+        pass
+
+    again = ListItem(id=reused_id, item_name='Butter', category='Dairy', list_id=list_id, added_by_id=owner.id,
+                     is_purchased=True, purchased_at=long_ago)
+    db.session.add(again)
+    db.session.commit()
+    while archive_batch():
+        pass
+
+    rows = db.session.query(ListItemArchive).filter_by(list_id=list_id).all()
+    assert [row.item_id for row in rows] == [reused_id, reused_id]
+    assert db.session.query(ListItem).filter_by(list_id=list_id).count() == 0
+
+
+def test_ticking_an_item_through_the_orm_stamps_purchased_at(app, db):
+    owner = User(username='archivestamp')
+    owner.set_password('password')
+    db.session.add(owner)
+    db.session.commit()
+    shopping_list = ShoppingList(name='Stamp List', owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    item = ListItem(item_name='Jam', category='Other', list_id=shopping_list.id, added_by_id=owner.id)
+    db.session.add(item)
+    db.session.commit()
+    assert item.purchased_at is None
+
+    item.is_purchased = True
+    db.session.commit()
+    assert item.purchased_at is not None
+    item.is_purchased = False
+    db.session.commit()
+    assert item.purchased_at is None
@@ -0,0 +1,62 @@
+import json
+import os
+import random
+import re
+
+import pytest
+
+from shopping_list_app.categorize import (
+    GROCERY_CATEGORIES, PRIORITY_RULES, categorize, categorize_many, categorize_naive
+)
+
+MAIN_JS = os.path.join(os.path.dirname(__file__), '..', 'shopping_list_app', 'static', 'js', 'main.js')
+
+
+def _js_grocery_categories():
+    """Parse the groceryCategories object literal out of main.js."""
+    with open(MAIN_JS, encoding='utf-8') as f:
+        source = f.read()
+    literal = re.search(r'const groceryCategories = (\{.*?\n\});', source, re.S).group(1)
+    literal = re.sub(r'//[^\n]*', '', literal)
+    return json.loads(literal)
+
+
+def test_keyword_table_matches_main_js():
+    js_categories = _js_grocery_categories()
+    assert js_categories.pop('Other') == []
+    assert list(js_categories.items()) == [(category, list(keywords)) for category, keywords in GROCERY_CATEGORIES]
+
+
+@pytest.mark.parametrize('item_name, expected', [
+    ('Milk', 'Dairy'),
+    ('Frozen peas', 'Frozen Foods'),
+    ('TK-Spinat', 'Frozen Foods'),
+    ('Orange juice', 'Beverages'),
+    ('Kaffeebohnen', 'Beverages'),
+    ('Toilet paper', 'Household'),
+    ('Schokoladenmilch', 'Pantry Staples'),
+    ('Peanut butter', 'Pantry Staples'),  # Longest keyword beats 'butter'
+    ('Grüne Bohnen', 'Vegetables'),
+    ('Exotic Fruit X', 'Other'),
+    ('', 'Other'),
+])
+def test_categorize_examples(item_name, expected):
+    assert categorize(item_name) == expected
+
+
+def test_categorize_matches_reference_on_keywords_and_combinations():
+    keywords = [keyword for _, words in GROCERY_CATEGORIES for keyword in words]
+    keywords += [keyword for _, words in PRIORITY_RULES for keyword in words]
+    rng = random.Random(42)
+    names = list(keywords)
+    names += [f'{a} {b}' for a, b in zip(keywords, reversed(keywords))]
+    names += [''.join(rng.sample(keywords, 3)).upper() for _ in range(500)]
+    # Random fragments produce partial and overlapping matches
+    names += [''.join(rng.choice(keywords)[rng.randrange(3):] for _ in range(3)) for _ in range(500)]
+    for name in names:
+        assert categorize(name) == categorize_naive(name), name
+
+
+def test_categorize_many_preserves_order():
+    names = ['Apples', 'Milk', 'Apples', 'Soap']
+    assert categorize_many(names) == ['Fruits', 'Dairy', 'Fruits', 'Household']
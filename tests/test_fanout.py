@@ -0,0 +1,57 @@
+import json
+
+import eventlet
+import socketio
+
+from shopping_list_app.fanout import MemoryManager, create_client_manager
+
+
+def _worker(url):
+    """A Socket.IO server on a memory broker that records the event packets it sends."""
+    server = socketio.Server(async_mode='eventlet', client_manager=MemoryManager(url, channel='test'))
+    sent = []
+    server._send_eio_packet = lambda eio_sid, eio_packet: sent.append((eio_sid, eio_packet.data))
+    # Normally done when the first client connects; starts the listener greenlet
+    server.manager_initialized = True
+    server.manager.initialize()
+    return server, sent
+
+
+def _join(server, eio_sid, room):
+    sid = server.manager.connect(eio_sid, '/')
+    server.manager.enter_room(sid, '/', room)
+    return sid
+
+
+def _events(sent, eio_sid):
+    return [json.loads(data[1:]) for to, data in sent if to == eio_sid and data.startswith('2')]
+
+
+def test_events_reach_clients_on_every_worker():
+    (server_a, sent_a), (server_b, sent_b) = _worker('memory://fanout-test'), _worker('memory://fanout-test')
+    _join(server_a, 'client-a', 'list_1')
+    _join(server_b, 'client-b', 'list_1')
+    _join(server_b, 'client-other', 'list_2')
+
+    server_a.emit('item_added', {'item': {'id': 5}, 'list_id': 1}, room='list_1')
+    server_a.emit('item_deleted', {'item_id': 5, 'list_id': 1}, room='list_1')
+    eventlet.sleep(0.05)  # Let the listener greenlets deliver
+
+    expected = [['item_added', {'item': {'id': 5}, 'list_id': 1}], ['item_deleted', {'item_id': 5, 'list_id': 1}]]
+    assert _events(sent_a, 'client-a') == expected
+    assert _events(sent_b, 'client-b') == expected
+    assert _events(sent_b, 'client-other') == []
+
+
+def test_brokers_are_isolated_by_name():
+    (server_a, _), (server_b, sent_b) = _worker('memory://fanout-left'), _worker('memory://fanout-right')
+    _join(server_b, 'client-b', 'list_1')
+    server_a.emit('item_added', {'list_id': 1}, room='list_1')
+    eventlet.sleep(0.05)
+    assert _events(sent_b, 'client-b') == []
+
+
+def test_client_manager_is_chosen_by_url():
+    assert isinstance(create_client_manager('memory://x'), MemoryManager)
+    assert create_client_manager('redis://localhost:6379/0') is None
+    assert create_client_manager(None) is None
@@ -0,0 +1,84 @@
+from flask import g, url_for
+
+from shopping_list_app.app import ShoppingList, User
+from shopping_list_app.identity import load_identity
+
+
+def _user_lookups(statements):
+    return [statement for statement in statements if 'FROM user' in statement]
+
+
+def _request(client, method, url, **kwargs):
+    # Test requests share the fixture's app context; drop the user Flask-Login kept in g
+    g.pop('_login_user', None)
+    return client.open(url, method=method, **kwargs)
+
+
+def test_identity_is_loaded_once_then_cached(app, db, create_user_fixture, count_queries):
+    create_user_fixture(username='identity_user', password='password')
+    user_id = db.session.query(User.id).filter_by(username='identity_user').scalar()
+
+    with count_queries() as statements:
+        identity = load_identity(str(user_id))
+    assert len(statements) == 1
+    assert (identity.id, identity.username, identity.favorite_list_id) == (user_id, 'identity_user', None)
+    assert identity.is_authenticated and identity.get_id() == str(user_id)
+
+    with count_queries() as statements:
+        assert load_identity(user_id) is identity
+    assert statements == []
+    assert load_identity(987654) is None
+
+
+def test_authenticated_requests_do_not_query_the_user(auth_client_fixture, app, db, count_queries):
+    authed_client = auth_client_fixture(username='identity_requests')
+    _request(authed_client, 'GET', url_for('main.dashboard'))
+    with count_queries() as statements:
+        response = _request(authed_client, 'GET', url_for('main.dashboard'))
+    assert response.status_code == 200
+    assert _user_lookups(statements) == []
+
+
+def test_user_writes_invalidate_the_identity(app, db, create_user_fixture):
+    create_user_fixture(username='identity_renamed', password='password')
+    user = db.session.query(User).filter_by(username='identity_renamed').first()
+    assert load_identity(user.id).username == 'identity_renamed'
+
+    user.username = 'identity_renamed_2'
+    db.session.flush()
+    # Not committed yet: the cached identity is still the committed state
+    assert load_identity(user.id).username == 'identity_renamed'
+    db.session.commit()
+    assert load_identity(user.id).username == 'identity_renamed_2'
+
+
+def test_favorite_toggle_and_list_deletion_update_the_identity(auth_client_fixture, create_user_fixture, app, db):
+    authed_client = auth_client_fixture(username='identity_owner')
+    create_user_fixture(username='identity_fan', password='password')
+    fan_client = app.test_client()
+    fan_client.post('/auth/login', data={'username': 'identity_fan', 'password': 'password'})
+
+    owner = db.session.query(User).filter_by(username='identity_owner').first()
+    fan = db.session.query(User).filter_by(username='identity_fan').first()
+    owner_id, fan_id = owner.id, fan.id
+    shopping_list = ShoppingList(name='Favorite List', owner_id=owner_id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+    _request(authed_client, 'POST', url_for('main.share_list', list_id=list_id), data={'share_with_username': 'identity_fan'})
+
+    for client in (authed_client, fan_client):
+        _request(client, 'POST', url_for('main.set_favorite_list', list_id=list_id))
+        response = _request(client, 'GET', url_for('main.index'))
+        assert response.status_code == 302
+        assert response.location.endswith(url_for('main.list_detail', list_id=list_id, _external=False))
+    assert load_identity(fan_id).favorite_list_id == list_id
+
+    # Toggling again removes the favorite
+    _request(authed_client, 'POST', url_for('main.set_favorite_list', list_id=list_id))
+    assert load_identity(owner_id).favorite_list_id is None
+
+    # Deleting the list clears it as everyone's favorite
+    _request(authed_client, 'POST', url_for('main.delete_list', list_id=list_id))
+    assert load_identity(fan_id).favorite_list_id is None
+    assert db.session.get(User, fan_id).favorite_list_id is None
@@ -1,5 +1,8 @@
-from flask import url_for
+from flask import g, url_for
 from shopping_list_app.app import ShoppingList, ListItem, ListShare, User
+from shopping_list_app.models import ListChange, SyncReceipt
+from sqlalchemy.dialects import mysql, postgresql
+from shopping_list_app.counters import _supports_returning, drifted_list_ids, repair_list_counters
 
 # Helper function to get a user (could be a fixture too)
 def get_user(db_session, username):
@@ -276,3 +279,264 @@ def test_add_item_without_category_defaults_to_other(auth_client_fixture, app, d
         assert list_item is not None
         assert list_item.category == "Other" # Default category
         assert list_item.added_by_id == user_id
+
+def test_dashboard_shows_owned_and_shared_lists_with_counts(auth_client_fixture, create_user_fixture, app, db):
+    """Test the dashboard lists owned and shared lists with item statistics."""
+    authed_client = auth_client_fixture(username='dashcounter')
+    with app.app_context():
+        user = get_user(db.session, 'dashcounter')
+        create_user_fixture(username='dashsharer', password='password')
+        other = get_user(db.session, 'dashsharer')
+        own_list = ShoppingList(name='Counted Own List', owner_id=user.id)
+        shared_list = ShoppingList(name='Counted Shared List', owner_id=other.id)
+        hidden_list = ShoppingList(name='Counted Hidden List', owner_id=other.id)
+        db.session.add_all([own_list, shared_list, hidden_list])
+        db.session.commit()
+        db.session.add(ListShare(list_id=shared_list.id, user_id=user.id))
+        db.session.add_all([
+            ListItem(item_name='Apples', list_id=own_list.id, added_by_id=user.id),
+            ListItem(item_name='Pears', list_id=own_list.id, added_by_id=user.id, is_purchased=True),
+        ])
+        db.session.commit()
+
+    response = authed_client.get(url_for('main.dashboard'))
+    assert response.status_code == 200
+    assert b'Counted Own List' in response.data
+    assert b'Counted Shared List' in response.data
+    assert b'Counted Hidden List' not in response.data
+    assert b'Owner: dashsharer' in response.data
+    assert b'1 open / 2 items' in response.data
+    assert b'0 open / 0 items' in response.data
+
+def test_list_counters_follow_every_write_path(auth_client_fixture, app, db):
+    """Test that item_count, open_item_count, version and updated_at are kept by each kind of write."""
+    authed_client = auth_client_fixture(username='listcounter')
+    user = get_user(db.session, 'listcounter')
+    shopping_list = ShoppingList(name='Counter List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+
+    def counters():
+        db.session.expire_all()
+        counted = db.session.get(ShoppingList, list_id)
+        assert list_id not in drifted_list_ids()
+        return counted.item_count, counted.open_item_count
+
+    api = lambda name, **kwargs: authed_client.post(url_for(f'main.{name}', list_id=list_id), **kwargs).get_json()
+    first = api('api_add_item', json={'item_name': 'Milk'})['item']['id']
+    assert counters() == (1, 1)
+    batch = [item['id'] for item in api('api_add_items_batch', json={'items': [{'item_name': 'Eggs'},
+                                                                               {'item_name': 'Bread'}]})['items']]
+    assert counters() == (3, 3)
+    api('api_set_items_purchased', json={'item_ids': batch, 'is_purchased': True})
+    assert counters() == (3, 1)
+    api('api_delete_item', json={'item_id': first})
+    assert counters() == (2, 0)
+    api('api_sync_offline_queue', json={'queue': [
+        {'type': 'add', 'data': {'item_name': 'Tea', 'temp_id': 'temp_counter_1'}},
+        {'type': 'delete', 'data': {'item_id': batch[0]}},
+    ]})
+    assert counters() == (2, 1)
+    api('api_clear_purchased')
+    assert counters() == (1, 1)
+
+    refreshed = db.session.get(ShoppingList, list_id)
+    assert refreshed.version == db.session.query(ListChange).filter_by(list_id=list_id).count()
+    assert refreshed.updated_at >= refreshed.created_at
+
+def test_repair_list_counters_command(app, db):
+    """Test that the repair command recomputes the counters of lists changed behind record_changes()."""
+    owner = User(username='counterrepair')
+    owner.set_password('password')
+    db.session.add(owner)
+    db.session.commit()
+    shopping_list = ShoppingList(name='Drifted List', owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+    _fill_list(db, list_id, [owner.id], 3)
+    assert list_id in drifted_list_ids()
+
+    runner = app.test_cli_runner()
+    assert str(list_id) in runner.invoke(args=['repair-list-counters', '--check']).output
+    assert list_id in drifted_list_ids()
+    result = runner.invoke(args=['repair-list-counters'])
+    assert result.exit_code == 0 and 'repaired' in result.output
+    db.session.expire_all()
+    repaired = db.session.get(ShoppingList, list_id)
+    assert (repaired.item_count, repaired.open_item_count, repaired.version) == (3, 3, 0)
+    assert list_id not in drifted_list_ids()
+
+def test_databases_without_returning_are_refused(db):
+    """Test that only databases with UPDATE/DELETE ... RETURNING are accepted for the counter writes."""
+    assert _supports_returning(db.engine.dialect)
+    assert _supports_returning(postgresql.dialect())
+    assert not _supports_returning(mysql.dialect())
+
+def _fill_list(db, list_id, adder_ids, count):
+    """Bulk insert `count` items spread over several adders."""
+    db.session.execute(ListItem.__table__.insert(), [
+        {'list_id': list_id, 'item_name': f'Item {n}', 'category': 'Other',
+         'is_purchased': False, 'added_by_id': adder_ids[n % len(adder_ids)]}
+        for n in range(count)
+    ])
+    db.session.commit()
+
+def test_list_detail_query_count_is_constant(auth_client_fixture, create_user_fixture, app, db, count_queries):
+    """Test that rendering a list does not issue a query per item or per adder."""
+    authed_client = auth_client_fixture(username='bigliststore')
+    with app.app_context():
+        user = get_user(db.session, 'bigliststore')
+        adder_ids = [user.id]
+        for n in range(20):
+            create_user_fixture(username=f'bigadder{n}', password='password')
+            adder_ids.append(get_user(db.session, f'bigadder{n}').id)
+        small_list = ShoppingList(name='Small List', owner_id=user.id)
+        big_list = ShoppingList(name='Big List', owner_id=user.id)
+        db.session.add_all([small_list, big_list])
+        db.session.commit()
+        small_list_id, big_list_id = small_list.id, big_list.id
+        _fill_list(db, small_list_id, adder_ids[:2], 5)
+        _fill_list(db, big_list_id, adder_ids, 1000)
+        repair_list_counters()  # The bulk inserts bypass record_changes()
+
+    # Warm up both pages so login and access caches are in the same state for each measurement
+    authed_client.get(url_for('main.list_detail', list_id=small_list_id))
+    authed_client.get(url_for('main.list_detail', list_id=big_list_id))
+
+    with count_queries() as small_statements:
+        response = authed_client.get(url_for('main.list_detail', list_id=small_list_id))
+    assert response.status_code == 200
+    with count_queries() as big_statements:
+        response = authed_client.get(url_for('main.list_detail', list_id=big_list_id))
+    assert response.status_code == 200
+    # The big list is windowed: its first page is rendered and the rest is fetched by cursor
+    assert response.data.count(b'<li id="item-') == 200
+    # One statement more than the small list, whose items come from its cached snapshot: the page query
+    assert len(big_statements) == len(small_statements) + 1
+
+def test_delete_list_is_set_based(auth_client_fixture, create_user_fixture, app, db, count_queries):
+    """Test that deleting a list removes its rows without loading them: the same statements for any size."""
+    authed_client = auth_client_fixture(username='listdeleter')
+    create_user_fixture(username='listdeleterguest', password='password')
+    owner_id = get_user(db.session, 'listdeleter').id
+    guest_id = get_user(db.session, 'listdeleterguest').id
+    authed_client.get(url_for('main.dashboard'))  # Warm up the identity cache so both deletes start alike
+
+    statement_counts = []
+    for size in (2, 500):
+        shopping_list = ShoppingList(name=f'Doomed {size}', owner_id=owner_id)
+        db.session.add(shopping_list)
+        db.session.commit()
+        list_id = shopping_list.id
+        _fill_list(db, list_id, [owner_id], size)
+        db.session.add(ListItem(item_name='Logged', category='Other', list_id=list_id, added_by_id=owner_id))
+        db.session.add(ListShare(list_id=list_id, user_id=guest_id))
+        db.session.add(SyncReceipt(user_id=owner_id, list_id=list_id, temp_id=f'temp-{size}', item_id=1))
+        db.session.commit()
+        db.session.expunge_all()
+
+        with count_queries() as statements:
+            response = authed_client.post(url_for('main.delete_list', list_id=list_id))
+        assert response.status_code == 302
+        statement_counts.append(len(statements))
+        for model in (ListItem, ListShare, ListChange, SyncReceipt):
+            assert db.session.query(model).filter_by(list_id=list_id).count() == 0
+        assert db.session.get(ShoppingList, list_id) is None
+
+    assert statement_counts[0] == statement_counts[1]
+
+def test_list_items_query_uses_composite_index(app, db):
+    """Test that loading a list's items in order is an index search, not a table scan and sort."""
+    query = db.select(ListItem.id).where(ListItem.list_id == 1).order_by(ListItem.added_at.asc())
+    compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+    assert 'ix_list_item_list_id_added_at' in plan and 'SCAN' not in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_item_page_query_uses_pagination_index(app, db):
+    """Test that a page after a cursor is an index range search, not a table scan and sort."""
+    from datetime import datetime
+    from sqlalchemy import tuple_
+    query = db.select(ListItem.id).where(ListItem.list_id == 1)\
+        .where(tuple_(ListItem.category, ListItem.added_at, ListItem.id) > ('Dairy', datetime(2025, 1, 1), 5))\
+        .order_by(ListItem.category, ListItem.added_at, ListItem.id).limit(200)
+    compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+    assert 'ix_list_item_list_id_category_added_at_id' in plan and 'SCAN' not in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_list_detail_conditional_get(auth_client_fixture, app, db, count_queries):
+    """Test that an unchanged list page is answered with 304 without loading its items."""
+    authed_client = auth_client_fixture(username='etaguser')
+    with app.app_context():
+        user = get_user(db.session, 'etaguser')
+        shopping_list = ShoppingList(name='ETag List', owner_id=user.id)
+        db.session.add(shopping_list)
+        db.session.commit()
+        list_id = shopping_list.id
+        db.session.add(ListItem(item_name='Apples', category='Fruits', list_id=list_id, added_by_id=user.id))
+        db.session.commit()
+
+    response = authed_client.get(url_for('main.list_detail', list_id=list_id))
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    with count_queries() as statements:
+        response = authed_client.get(url_for('main.list_detail', list_id=list_id), headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not any('FROM list_item' in statement for statement in statements)
+
+    # Adding an item changes the version, so the page is rendered again
+    authed_client.post(url_for('main.list_detail', list_id=list_id), data={'item_name': 'Pears'})
+    response = authed_client.get(url_for('main.list_detail', list_id=list_id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Pears' in response.data
+    assert response.headers['ETag'] != etag
+
+    # Starring the list changes the page as well
+    etag = response.headers['ETag']
+    authed_client.post(url_for('main.set_favorite_list', list_id=list_id), follow_redirects=True)
+    g.pop('_login_user', None)  # The test's app context outlives requests; reload the user like a new one would
+    response = authed_client.get(url_for('main.list_detail', list_id=list_id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    # So does a deploy with new templates or scripts
+    etag = response.headers['ETag']
+    build_id = app.config['BUILD_ID']
+    app.config['BUILD_ID'] = 'next-deploy'
+    try:
+        response = authed_client.get(url_for('main.list_detail', list_id=list_id), headers={'If-None-Match': etag})
+    finally:
+        app.config['BUILD_ID'] = build_id
+    assert response.status_code == 200
+
+
+def test_large_list_detail_is_windowed(auth_client_fixture, app, db):
+    """Lists over LIST_PAGE_SIZE items render their first page and a cursor for the rest."""
+    authed_client = auth_client_fixture(username='windowed')
+    user = get_user(db.session, 'windowed')
+    shopping_list = ShoppingList(name='Long List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+    for name, category in [('Zucchini', 'Vegetables'), ('Apples', 'Fruits'), ('Bagels', 'Bakery')]:
+        db.session.add(ListItem(item_name=name, category=category, list_id=list_id, added_by_id=user.id))
+    db.session.commit()
+
+    app.config['LIST_PAGE_SIZE'] = 2
+    try:
+        response = authed_client.get(url_for('main.list_detail', list_id=list_id))
+    finally:
+        app.config.pop('LIST_PAGE_SIZE')
+    assert response.status_code == 200
+    assert b'id="load-more-items"' in response.data
+    # The first page in pagination order: Bakery, then Fruits
+    assert b'Bagels' in response.data and b'Apples' in response.data
+    assert b'Zucchini' not in response.data
+
+    response = authed_client.get(url_for('main.list_detail', list_id=list_id))
+    assert b'id="load-more-items"' not in response.data
+    assert b'Zucchini' in response.data
@@ -0,0 +1,114 @@
+import logging
+import re
+
+from flask import url_for
+
+from shopping_list_app.app import ShoppingList, User
+from shopping_list_app.logs import LOGGER_NAME, SamplingFilter, configure_logging
+from shopping_list_app.metrics import MetricsRegistry
+from shopping_list_app.outbox import dispatch_pending
+
+
+def _metric(text, name, **labels):
+    """Return the value of the sample `name` whose labels include `labels`, or None."""
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)\{(.*)\} (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        sample_labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        if all(sample_labels.get(key) == str(value) for key, value in labels.items()):
+            return float(match.group(3))
+    return None
+
+
+def _metric_value(text, name):
+    """Return the value of the unlabelled sample `name`, or None."""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.split()[1])
+    return None
+
+
+def test_metrics_report_request_latency_sql_and_emits(auth_client_fixture, app, db):
+    authed_client = auth_client_fixture(username='metricsuser')
+    with app.app_context():
+        user = db.session.query(User).filter_by(username='metricsuser').first()
+        shopping_list = ShoppingList(name='Metrics List', owner_id=user.id)
+        db.session.add(shopping_list)
+        db.session.commit()
+        list_id = shopping_list.id
+
+    authed_client.get(url_for('main.list_detail', list_id=list_id))
+    authed_client.post(url_for('main.api_add_item', list_id=list_id), json={'item_name': 'Milk'})
+    with app.app_context():
+        dispatch_pending()
+
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        response = authed_client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    finally:
+        app.config['METRICS_TOKEN'] = None
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert _metric(text, 'http_request_duration_seconds_count', endpoint='main.list_detail', method='GET') >= 1
+    assert _metric(text, 'http_request_duration_seconds_bucket', endpoint='main.list_detail', method='GET', le='+Inf') >= 1
+    assert _metric(text, 'http_requests_total', endpoint='main.api_add_item', method='POST', status=200) >= 1
+    assert _metric(text, 'db_statements_total', endpoint='main.list_detail') >= 1
+    assert _metric(text, 'db_statement_duration_seconds_total', endpoint='main.list_detail') > 0
+    assert _metric(text, 'socketio_emits_total', event='list_delta') >= 1
+    assert f'list_{list_id}' not in text
+    assert _metric(text, 'outbox_delivery_lag_seconds_bucket', le='+Inf') >= 1
+    assert _metric_value(text, 'realtime_messages_sent_total') >= 1
+
+
+def test_metrics_require_the_token(client, app):
+    assert client.get('/metrics').status_code == 404
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_room_sizes_are_rendered_as_aggregate_gauges():
+    text = MetricsRegistry().render({'list_7': 3, 'list_8': 2})
+    assert _metric_value(text, 'socketio_rooms') == 2
+    assert _metric_value(text, 'socketio_room_members') == 5
+    assert _metric_value(text, 'socketio_room_members_max') == 3
+    assert _metric(text, 'socketio_rooms_by_size', le=2) == 1
+    assert _metric(text, 'socketio_rooms_by_size', le=5) == 2
+    assert _metric(text, 'socketio_rooms_by_size', le='+Inf') == 2
+    assert 'list_7' not in text
+
+
+def test_logging_defers_to_configured_handlers(app):
+    logger = logging.getLogger(LOGGER_NAME)
+    root = logging.getLogger()
+    saved_handlers, saved_root_handlers = logger.handlers[:], root.handlers[:]
+    host_handler = logging.NullHandler()
+    try:
+        logger.handlers = []
+        root.handlers = [host_handler]
+        assert configure_logging(app).handlers == []
+        assert logger.propagate
+
+        root.handlers = []
+        handlers = configure_logging(app).handlers
+        assert [getattr(handler, 'sampled', False) for handler in handlers] == [True]
+        assert logger.propagate
+    finally:
+        logger.handlers, root.handlers = saved_handlers, saved_root_handlers
+
+
+def test_sampling_filter_only_samples_debug_records():
+    def record(level):
+        return logging.LogRecord('shopping_list_app.main', level, __file__, 1, 'message', None, None)
+
+    never = SamplingFilter(rate=0.0)
+    assert not never.filter(record(logging.DEBUG))
+    assert never.filter(record(logging.INFO))
+    assert never.filter(record(logging.WARNING))
+    assert SamplingFilter(rate=1.0).filter(record(logging.DEBUG))
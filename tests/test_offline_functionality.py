@@ -137,17 +137,17 @@ class OfflineFunctionalityTestCase(unittest.TestCase):
         # Should return all items (3)
         self.assertEqual(len(data['items']), 3)
         
-        # Get the timestamp from the response
-        timestamp = data['timestamp']
+        # Get the list version from the response
+        version = data['version']
         
         # Add another item
         another_item = ListItem(item_name='Yogurt', category='Dairy', list_id=self.test_list.id, added_by_id=self.test_user.id)
         db.session.add(another_item)
         db.session.commit()
         
-        # Get updates since the last timestamp
+        # Get updates since the last version
         response = self.client.get(
-            f'/api/list/{self.test_list.id}/updates?since={timestamp}'
+            f'/api/list/{self.test_list.id}/updates?since={version}'
         )
         
         self.assertEqual(response.status_code, 200)
@@ -213,7 +213,7 @@ class OfflineManagerJSTestCase(unittest.TestCase):
             'password': 'password'
         }, follow_redirects=True)
 
-    @patch('shopping_list_app.main.socketio')
+    @patch('shopping_list_app.realtime.socketio')
     def test_offline_online_transition_integration(self, mock_socketio):
         """Test the full offline to online transition flow"""
         self.login()
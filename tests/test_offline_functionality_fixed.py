@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from shopping_list_app.app import create_app
 from shopping_list_app.models import db, User, ShoppingList, ListItem
+from shopping_list_app.changelog import current_version
 
 class OfflineFunctionalityTestCase(unittest.TestCase):
     def setUp(self):
@@ -104,33 +105,38 @@ class OfflineFunctionalityTestCase(unittest.TestCase):
         self.assertIsNone(deleted_item)
         
     def test_api_updates_since_endpoint(self):
-        """Test the API endpoint for getting updates since a timestamp"""
+        """Test the API endpoint for getting updates since a list version"""
         # Login the user programmatically
         with self.client.session_transaction() as sess:
             sess['_fresh'] = True
-            sess['user_id'] = self.test_user.id
+            sess['_user_id'] = str(self.test_user.id)
         
-        # Get current timestamp in milliseconds
-        import time
-        timestamp = int(time.time() * 1000)
+        # The bulk-saved setUp items are not in the change log, so log one change to start from a non-zero version
+        db.session.add(ListItem(item_name='Cheese', category='Dairy', list_id=1, added_by_id=1))
+        db.session.commit()
+        version = current_version(self.test_list.id)
         
-        # Add a new item after the timestamp
+        # Add a new item after that version
         new_item = ListItem(item_name='Yogurt', category='Dairy', list_id=1, added_by_id=1)
         db.session.add(new_item)
         db.session.commit()
         
-        # Get updates since the last timestamp
+        # Get updates since the last version
         response = self.client.get(
-            f'/api/list/{self.test_list.id}/updates?since={timestamp}'
+            f'/api/list/{self.test_list.id}/updates?since={version}'
         )
         
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertTrue(data['success'])
         
-        # Should only return the new item (1)
+        # Should only return the new item (1), as a delta up to the new version
+        self.assertFalse(data['full'])
+        self.assertEqual(data['version'], version + 1)
         self.assertEqual(len(data['items']), 1)
         self.assertEqual(data['items'][0]['item_name'], 'Yogurt')
+        self.assertEqual(data['items'][0]['change_type'], 'added')
+        self.assertEqual(data['deleted_item_ids'], [])
 
 class OfflineManagerJSTestCase(unittest.TestCase):
     """Test cases for the JavaScript OfflineManager class"""
@@ -166,7 +172,7 @@ class OfflineManagerJSTestCase(unittest.TestCase):
         db.drop_all()
         self.app_context.pop()
     
-    @patch('shopping_list_app.main.socketio')
+    @patch('shopping_list_app.realtime.socketio')
     def test_offline_online_transition_integration(self, mock_socketio):
         """Test the full offline to online transition flow"""
         # Login the user programmatically
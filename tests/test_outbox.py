@@ -0,0 +1,201 @@
+import time
+from unittest.mock import patch
+
+import eventlet
+from flask import url_for
+
+from shopping_list_app.app import ShoppingList, User
+from shopping_list_app.metrics import get_metrics
+from shopping_list_app.models import OutboxEvent
+from shopping_list_app.outbox import dispatch_pending, enqueue_event, get_dispatcher, get_room_throttle
+
+
+def _make_list(db, name):
+    owner = User(username=f'{name}-owner')
+    owner.set_password('password')
+    db.session.add(owner)
+    db.session.flush()
+    shopping_list = ShoppingList(name=name, owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    return shopping_list.id
+
+
+def _drain():
+    with patch('shopping_list_app.realtime.socketio'):
+        while dispatch_pending():
+            pass
+
+
+def test_event_is_stored_with_the_change_and_not_emitted_by_the_request(auth_client_fixture, app, db):
+    authed_client = auth_client_fixture(username='outboxuser')
+    user = db.session.query(User).filter_by(username='outboxuser').first()
+    shopping_list = ShoppingList(name='Outbox List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        response = authed_client.post(url_for('main.api_add_item', list_id=list_id), json={'item_name': 'Milk'})
+    assert response.status_code == 200
+    mock_socketio.emit.assert_not_called()
+
+    events = db.session.query(OutboxEvent).filter_by(list_id=list_id).all()
+    assert [event.event for event in events] == ['item_added']
+    assert '"Milk"' in events[0].payload
+
+
+def test_rolled_back_transaction_leaves_no_event(app, db):
+    list_id = _make_list(db, 'Rollback List')
+    enqueue_event(list_id, 'item_deleted', {'item_id': 1, 'list_id': list_id})
+    db.session.rollback()
+    assert db.session.query(OutboxEvent).filter_by(list_id=list_id).count() == 0
+
+
+def test_dispatch_coalesces_events_per_room_in_sequence_order(app, db):
+    _drain()
+    first, second = _make_list(db, 'Coalesce A'), _make_list(db, 'Coalesce B')
+    enqueue_event(first, 'item_deleted', {'item_id': 1, 'list_id': first})
+    enqueue_event(second, 'item_deleted', {'item_id': 2, 'list_id': second})
+    enqueue_event(first, 'item_deleted', {'item_id': 3, 'list_id': first})
+    db.session.commit()
+
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        assert dispatch_pending() == 3
+    emits = {call.kwargs['room']: call.args for call in mock_socketio.emit.call_args_list}
+    assert set(emits) == {f'list_{first}', f'list_{second}'}
+    name, payload = emits[f'list_{first}']
+    assert name == 'list_delta'
+    assert [event['data']['item_id'] for event in payload['events']] == [1, 3]
+    seqs = [event['seq'] for event in payload['events']]
+    assert seqs == sorted(seqs)
+    assert db.session.query(OutboxEvent).count() == 0
+
+
+def test_seq_is_not_reused_after_the_outbox_is_emptied(app, db):
+    seqs = []
+    for item_id in (1, 2, 3):
+        _drain()
+        list_id = _make_list(db, f'Seq List {item_id}')  # A new room each round, so the room rate never holds it back
+        enqueue_event(list_id, 'item_deleted', {'item_id': item_id, 'list_id': list_id})
+        db.session.commit()
+        with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+            assert dispatch_pending() == 1
+        seqs += [event['seq'] for event in mock_socketio.emit.call_args.args[1]['events']]
+        assert db.session.query(OutboxEvent).count() == 0
+    # Clients drop an event whose seq they have seen, so each drain must get a new one
+    assert seqs == sorted(set(seqs))
+
+
+def test_events_stay_in_the_outbox_when_the_emit_fails(app, db):
+    _drain()
+    list_id = _make_list(db, 'Retry List')
+    enqueue_event(list_id, 'item_deleted', {'item_id': 9, 'list_id': list_id})
+    db.session.commit()
+
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        mock_socketio.emit.side_effect = ConnectionError('broker down')
+        try:
+            dispatch_pending()
+        except ConnectionError:
+            pass
+    assert db.session.query(OutboxEvent).filter_by(list_id=list_id).count() == 1
+
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        assert dispatch_pending() == 1
+    assert mock_socketio.emit.call_args.args[1]['events'][0]['data']['item_id'] == 9
+
+
+def test_dispatcher_greenlet_sends_events_after_commit(app, db):
+    _drain()
+    list_id = _make_list(db, 'Dispatcher List')
+    dispatcher = get_dispatcher(app)
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        dispatcher.start()
+        try:
+            enqueue_event(list_id, 'item_deleted', {'item_id': 4, 'list_id': list_id})
+            db.session.commit()
+            for _ in range(50):
+                if mock_socketio.emit.called:
+                    break
+                eventlet.sleep(0.01)
+        finally:
+            dispatcher.stop()
+    assert mock_socketio.emit.call_args.kwargs['room'] == f'list_{list_id}'
+    assert db.session.query(OutboxEvent).filter_by(list_id=list_id).count() == 0
+
+
+def test_room_over_its_rate_keeps_events_for_its_next_message(app, db):
+    _drain()
+    busy, quiet = _make_list(db, 'Busy List'), _make_list(db, 'Quiet List')
+    enqueue_event(busy, 'item_deleted', {'item_id': 1, 'list_id': busy})
+    db.session.commit()
+    throttle = get_room_throttle(app)
+    with patch.object(throttle, 'min_interval', 60), patch('shopping_list_app.realtime.socketio'):
+        assert dispatch_pending() == 1
+
+    # Within the room's minimum interval only the other room is sent to
+    enqueue_event(busy, 'item_deleted', {'item_id': 2, 'list_id': busy})
+    enqueue_event(busy, 'item_deleted', {'item_id': 3, 'list_id': busy})
+    enqueue_event(quiet, 'item_deleted', {'item_id': 4, 'list_id': quiet})
+    db.session.commit()
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        assert dispatch_pending() == 1
+    assert [call.kwargs['room'] for call in mock_socketio.emit.call_args_list] == [f'list_{quiet}']
+    assert busy in throttle.throttled()
+
+    later = time.monotonic() + 61
+    with patch('shopping_list_app.outbox.time.monotonic', return_value=later), \
+            patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        assert dispatch_pending() == 2
+    payload = mock_socketio.emit.call_args.args[1]
+    assert [event['data']['item_id'] for event in payload['events']] == [2, 3]
+
+
+def test_dispatcher_coalesces_a_burst_of_commits(app, db):
+    _drain()
+    list_id = _make_list(db, 'Burst List')
+    dispatcher = get_dispatcher(app)
+    before = get_metrics(app).list_messages
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        dispatcher.start()
+        try:
+            for item_id in range(5):
+                enqueue_event(list_id, 'item_deleted', {'item_id': item_id, 'list_id': list_id})
+                db.session.commit()
+            for _ in range(50):
+                if mock_socketio.emit.called:
+                    break
+                eventlet.sleep(0.01)
+        finally:
+            dispatcher.stop()
+    mock_socketio.emit.assert_called_once()
+    assert len(mock_socketio.emit.call_args.args[1]['events']) == 5
+    assert get_metrics(app).list_messages == before + 1
+
+
+def test_api_change_is_not_echoed_to_the_client_that_made_it(auth_client_fixture, app, db):
+    _drain()
+    authed_client = auth_client_fixture(username='echouser')
+    user = db.session.query(User).filter_by(username='echouser').first()
+    shopping_list = ShoppingList(name='Echo List', owner_id=user.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    list_id = shopping_list.id
+
+    authed_client.post(url_for('main.api_add_item', list_id=list_id), json={'item_name': 'Eggs'},
+                       headers={'X-Socket-ID': 'sid-alice'})
+    authed_client.post(url_for('main.api_add_item', list_id=list_id), json={'item_name': 'Ham', 'socket_id': 'sid-bob'})
+    assert [event.origin_sid for event in db.session.query(OutboxEvent).filter_by(list_id=list_id)] == \
+        ['sid-alice', 'sid-bob']
+
+    with patch('shopping_list_app.realtime.socketio') as mock_socketio:
+        assert dispatch_pending() == 2
+    room_call, *direct_calls = mock_socketio.emit.call_args_list
+    assert room_call.kwargs['room'] == f'list_{list_id}'
+    assert sorted(room_call.kwargs['skip_sid']) == ['sid-alice', 'sid-bob']
+    assert len(room_call.args[1]['events']) == 2
+    # Each originator still gets the other's event, and only that
+    received = {call.kwargs['to']: [event['data']['item']['item_name'] for event in call.args[1]['events']]
+                for call in direct_calls}
+    assert received == {'sid-alice': ['Ham'], 'sid-bob': ['Eggs']}
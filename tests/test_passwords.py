@@ -0,0 +1,78 @@
+import time
+
+import eventlet
+from eventlet import tpool
+from flask import Flask
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+
+from shopping_list_app import passwords
+from shopping_list_app.app import User
+from shopping_list_app.passwords import configure_password_hashing, hash_password, verify_password, needs_rehash
+
+
+def test_hashes_use_the_configured_work_factor(app):
+    with app.app_context():
+        password_hash = hash_password('s3cret')
+        assert password_hash.startswith('pbkdf2:sha256:1000$')
+        assert verify_password(password_hash, 's3cret')
+        assert not verify_password(password_hash, 'wrong')
+        assert not needs_rehash(password_hash)
+        assert needs_rehash('pbkdf2:sha256:600000$salt$hash')
+
+
+def test_hashing_does_not_block_other_greenlets(app):
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            eventlet.sleep(0.005)
+
+    with app.app_context():
+        app.config['PASSWORD_HASH_ITERATIONS'] = 300000
+        try:
+            greenlet = eventlet.spawn(ticker)
+            eventlet.sleep(0)
+            started_at = time.perf_counter()
+            hash_password('s3cret')
+            finished_at = time.perf_counter()
+            greenlet.kill()
+        finally:
+            app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+    # The ticker kept running while the hash was computed in a worker thread
+    assert len([tick for tick in ticks if started_at < tick < finished_at]) >= 3
+
+
+def test_login_upgrades_outdated_hashes(client, app, db):
+    with app.app_context():
+        app.config['PASSWORD_HASH_ITERATIONS'] = 2000
+        try:
+            user = User(username='rehash_user')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+        finally:
+            app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+
+    client.post('/auth/login', data={'username': 'rehash_user', 'password': 'password'})
+    user = db.session.query(User).filter_by(username='rehash_user').first()
+    db.session.refresh(user)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert user.check_password('password')
+
+
+def test_thread_pool_is_sized_once_per_process(monkeypatch):
+    sizes = []
+    monkeypatch.setattr(passwords, '_pool_sized', False)
+    monkeypatch.setattr(tpool, 'set_num_threads', sizes.append)
+    for threads in (None, 4, 8):
+        app = Flask(__name__)
+        app.config['PASSWORD_HASH_THREADS'] = threads
+        configure_password_hashing(app)
+    assert sizes == [4]
+
+
+def test_work_factor_defaults_to_werkzeugs():
+    app = Flask(__name__)
+    with app.app_context():
+        assert not needs_rehash(f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}$salt$hash')
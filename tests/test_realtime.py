@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+from flask import g, url_for
+
+from shopping_list_app.app import ShoppingList, ListShare, User
+from shopping_list_app.extensions import socketio
+from shopping_list_app.realtime import ConnectRate, get_room_members, list_room
+
+
+def _forget_request_state():
+    # Socket.IO events and test requests share the fixture's app context; drop what Flask-Login and access keep in g
+    g.pop('_login_user', None)
+    g.pop('list_access', None)
+
+
+def _socket_client(app, authed_client):
+    _forget_request_state()
+    # Flask-SocketIO's flask_test_client= predates Werkzeug 3's cookie API, so pass the cookies by hand
+    cookies = '; '.join(f'{cookie.key}={cookie.value}' for cookie in authed_client._cookies.values())
+    return socketio.test_client(app, headers={'Cookie': cookies})
+
+
+def _join(socket_client, list_id):
+    _forget_request_state()
+    return socket_client.emit('join_list_room', {'list_id': list_id}, callback=True)
+
+
+def _room_sids(list_id):
+    return set(socketio.server.manager.rooms.get('/', {}).get(list_room(list_id), {}))
+
+
+def _make_list(db, owner_name, name):
+    owner = db.session.query(User).filter_by(username=owner_name).first()
+    shopping_list = ShoppingList(name=name, owner_id=owner.id)
+    db.session.add(shopping_list)
+    db.session.commit()
+    return shopping_list.id
+
+
+def test_join_is_authorized_and_counted(auth_client_fixture, app, db):
+    owner_client = auth_client_fixture(username='room_owner')
+    stranger_client = auth_client_fixture(username='room_stranger')
+    list_id = _make_list(db, 'room_owner', 'Room List')
+
+    owner_socket = _socket_client(app, owner_client)
+    assert _join(owner_socket, list_id) == {'success': True}
+    stranger_socket = _socket_client(app, stranger_client)
+    assert _join(stranger_socket, list_id) == {'success': False, 'error': 'Access denied'}
+    assert _join(stranger_socket, 'not-a-number') == {'success': False, 'error': 'Missing list_id'}
+
+    assert get_room_members(app).sizes()[list_room(list_id)] == 1
+    assert len(_room_sids(list_id)) == 1
+
+    owner_socket.disconnect()
+    stranger_socket.disconnect()
+    assert list_room(list_id) not in get_room_members(app).sizes()
+
+
+def test_removing_a_share_revokes_room_membership(auth_client_fixture, app, db):
+    owner_client = auth_client_fixture(username='revoke_owner')
+    guest_client = auth_client_fixture(username='revoke_guest')
+    list_id = _make_list(db, 'revoke_owner', 'Revoked List')
+    guest_id = db.session.query(User.id).filter_by(username='revoke_guest').scalar()
+    db.session.add(ListShare(list_id=list_id, user_id=guest_id))
+    db.session.commit()
+
+    guest_socket = _socket_client(app, guest_client)
+    owner_socket = _socket_client(app, owner_client)
+    assert _join(guest_socket, list_id) == {'success': True}
+    assert _join(owner_socket, list_id) == {'success': True}
+    assert len(_room_sids(list_id)) == 2
+
+    db.session.delete(db.session.query(ListShare).filter_by(list_id=list_id, user_id=guest_id).one())
+    db.session.commit()
+    assert len(_room_sids(list_id)) == 1
+    assert get_room_members(app).sizes()[list_room(list_id)] == 1
+    # The access cache was invalidated too, so the guest cannot join again
+    assert _join(_socket_client(app, guest_client), list_id) == {'success': False, 'error': 'Access denied'}
+
+    # Deleting the list closes its room
+    _forget_request_state()
+    owner_client.post(url_for('main.delete_list', list_id=list_id))
+    assert _room_sids(list_id) == set()
+    assert list_room(list_id) not in get_room_members(app).sizes()
+
+
+def test_connect_sends_reconnect_hint_that_grows_with_connect_rate(auth_client_fixture, app, monkeypatch):
+    client = auth_client_fixture(username='hint_user')
+    monkeypatch.setitem(app.extensions, 'shopping_list_connect_rate', ConnectRate(window=10))
+
+    # The test client of this Flask-SocketIO version does not see server emits, so watch emit() itself
+    with patch('shopping_list_app.app.emit') as emit:
+        calm = _socket_client(app, client)
+        emit.assert_called_once_with('reconnect_hint', {'delay_ms': 1000, 'delay_max_ms': 30000, 'jitter': 0.5})
+
+        # Three connections in a 10 s window is 0.3/s, six times a storm threshold of 0.05/s
+        monkeypatch.setitem(app.config, 'RECONNECT_STORM_RATE', 0.05)
+        _socket_client(app, client).disconnect()
+        storm = _socket_client(app, client)
+        assert emit.call_args.args[1]['delay_ms'] == 6000
+    calm.disconnect()
+    storm.disconnect()